@@ -0,0 +1,222 @@
+"""Local HTTP server that serves generated RSS and Atom feeds, used to benchmark TermRSS without a network.
+
+Usage: python benchmarks/feed_server.py [--port 8000] [--feeds 100] [--entries 50] [--summary-bytes 500]
+       [--latency-ms 0] [--error-every 0] [--no-conditional] [--change-every 0] [--gzip]
+
+Feeds are served at /feed/<n>.xml (even numbers are RSS 2.0, odd numbers Atom) and the list of all of
+them at /feeds.opml. Every document is generated from its number, so the same request always gets the
+same bytes until --change-every seconds pass and a new entry is published.
+"""
+import argparse
+import gzip
+import hashlib
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+WORDS = ("lorem","ipsum","dolor","sit","amet","consectetur","adipiscing","elit","sed","do","eiusmod",
+         "tempor","incididunt","ut","labore","et","dolore","magna","aliqua","feed","reader","terminal")
+
+
+class FeedServer():
+    def __init__(self,port=0,feeds=100,entries=50,summary_bytes=500,latency_ms=0,error_every=0,
+                 conditional=True,change_every=0,compress=False):
+        """Serves generated feeds on localhost from a background thread.
+
+        Args:
+            port (int, optional): Port to listen on. 0 picks a free one. Defaults to 0.
+            feeds (int, optional): Number of feeds served. Defaults to 100.
+            entries (int, optional): Entries on each feed. Defaults to 50.
+            summary_bytes (int, optional): Approximate size of the html summary of each entry. Defaults to 500.
+            latency_ms (int, optional): Delay added before answering each request. Defaults to 0.
+            error_every (int, optional): If not 0, every nth feed answers with an error code, cycling
+            through 404, 500, 503 and 410. Defaults to 0.
+            conditional (bool, optional): If False, ETag and Last-Modified are sent but ignored, so
+            every request gets a 200. Defaults to True.
+            change_every (int, optional): If not 0, a new entry is published on every feed after this
+            many seconds. Defaults to 0.
+            compress (bool, optional): If True, feeds are sent gzipped to clients that accept it.
+            Defaults to False.
+        """
+        self.feeds = feeds
+        self.entries = entries
+        self.summary_bytes = summary_bytes
+        self.latency = latency_ms / 1000
+        self.error_every = error_every
+        self.conditional = conditional
+        self.change_every = change_every
+        self.compress = compress
+        self.started = int(time.time())
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1",port),self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def url(self,n):
+        return f"http://127.0.0.1:{self.port}/feed/{n}.xml"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {"requests":self.requests,"not_modified":self.not_modified,"bytes_sent":self.bytes_sent,"connections":self.connections}
+
+    def generation(self):
+        """Number of times the feeds have changed since the server started."""
+        if self.change_every == 0:
+            return 0
+        return (int(time.time()) - self.started) // self.change_every
+
+    def error_code(self,n):
+        if self.error_every == 0 or (n + 1) % self.error_every != 0:
+            return None
+        return (404,500,503,410)[(n // self.error_every) % 4]
+
+    def summary(self,rng):
+        words = []
+        size = 0
+        while size < self.summary_bytes:
+            word = rng.choice(WORDS)
+            words.append(f"<b>{word}</b>" if rng.random() < 0.1 else word)
+            size += len(words[-1]) + 1
+        return "<p>" + " ".join(words) + "</p>"
+
+    def document(self,n):
+        """Generates the feed with number n. Returns its bytes and its last modification time."""
+        generation = self.generation()
+        step = self.change_every if self.change_every > 0 else 3600
+        newest = self.started + generation * step
+        rng = random.Random(n)
+        items = []
+        for i in range(self.entries):
+            number = generation + self.entries - i
+            published = newest - i * step #An entry keeps its date when newer ones are published.
+            title = f"Feed {n} entry {number}"
+            link = f"http://127.0.0.1:{self.port}/entry/{n}/{number}"
+            summary = escape(self.summary(rng))
+            if n % 2 == 0:
+                items.append(f"<item><title>{title}</title><link>{link}</link><guid>{link}</guid>"
+                             f"<pubDate>{formatdate(published)}</pubDate><description>{summary}</description></item>")
+            else:
+                date = time.strftime('%Y-%m-%dT%H:%M:%SZ',time.gmtime(published))
+                items.append(f"<entry><title>{title}</title><link href=\"{link}\"/><id>{link}</id>"
+                             f"<published>{date}</published><updated>{date}</updated><summary type=\"html\">{summary}</summary></entry>")
+        if n % 2 == 0:
+            body = (f"<?xml version=\"1.0\" encoding=\"utf-8\"?><rss version=\"2.0\"><channel><title>Feed {n}</title>"
+                    f"<link>http://127.0.0.1:{self.port}/</link><description>Generated feed</description>"
+                    + "".join(items) + "</channel></rss>")
+        else:
+            date = time.strftime('%Y-%m-%dT%H:%M:%SZ',time.gmtime(newest))
+            body = (f"<?xml version=\"1.0\" encoding=\"utf-8\"?><feed xmlns=\"http://www.w3.org/2005/Atom\"><title>Feed {n}</title>"
+                    f"<id>urn:feed:{n}</id><updated>{date}</updated>" + "".join(items) + "</feed>")
+        return body.encode("utf-8"),newest
+
+    def opml(self):
+        outlines = "".join(f"<outline type=\"rss\" text=\"Feed {n}\" title=\"Feed {n}\" xmlUrl=\"{self.url(n)}\"/>" for n in range(self.feeds))
+        return (f"<?xml version=\"1.0\"?><opml version=\"1.0\"><head><title>Benchmark feeds</title></head>"
+                f"<body><outline text=\"bench\" title=\"bench\">{outlines}</outline></body></opml>").encode("utf-8")
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" #Keeps connections open between requests.
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def log_message(self,format,*args):
+                pass
+
+            def send(self,code,body=b"",headers={}):
+                self.send_response(code)
+                for key,value in headers.items():
+                    self.send_header(key,value)
+                self.send_header("Content-Length",str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server.lock:
+                    server.requests += 1
+                    server.bytes_sent += len(body)
+                    if code == 304:
+                        server.not_modified += 1
+
+            def do_GET(self):
+                if server.latency > 0:
+                    time.sleep(server.latency)
+                if self.path == "/feeds.opml":
+                    self.send(200,server.opml(),{"Content-Type":"text/x-opml"})
+                    return
+                if self.path.startswith("/feed/") == False or self.path.endswith(".xml") == False:
+                    self.send(404)
+                    return
+                try:
+                    n = int(self.path[len("/feed/"):-len(".xml")])
+                except ValueError:
+                    self.send(404)
+                    return
+                if n >= server.feeds:
+                    self.send(404)
+                    return
+                error = server.error_code(n)
+                if error != None:
+                    self.send(error,b"",{"Retry-After":"120"} if error == 503 else {})
+                    return
+                body,modified = server.document(n)
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                last_modified = formatdate(modified,usegmt=True)
+                headers = {"Content-Type":"application/xml","ETag":etag,"Last-Modified":last_modified}
+                if server.conditional and (self.headers.get("If-None-Match") == etag or self.headers.get("If-Modified-Since") == last_modified):
+                    self.send(304,b"",headers)
+                    return
+                if server.compress and "gzip" in self.headers.get("Accept-Encoding",""):
+                    body = gzip.compress(body,mtime=0)
+                    headers["Content-Encoding"] = "gzip"
+                self.send(200,body,headers)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port",type=int,default=8000)
+    parser.add_argument("--feeds",type=int,default=100)
+    parser.add_argument("--entries",type=int,default=50)
+    parser.add_argument("--summary-bytes",type=int,default=500)
+    parser.add_argument("--latency-ms",type=int,default=0)
+    parser.add_argument("--error-every",type=int,default=0)
+    parser.add_argument("--no-conditional",action="store_true")
+    parser.add_argument("--change-every",type=int,default=0)
+    parser.add_argument("--gzip",action="store_true")
+    args = parser.parse_args()
+    server = FeedServer(args.port,args.feeds,args.entries,args.summary_bytes,args.latency_ms,args.error_every,
+                        args.no_conditional == False,args.change_every,args.gzip)
+    print(f"Serving {args.feeds} feeds on http://127.0.0.1:{server.port}/feeds.opml")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
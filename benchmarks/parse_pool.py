@@ -0,0 +1,60 @@
+"""Measures how much faster updates get when feeds are parsed on worker processes (parse_workers), by
+running `update -r` against a local synthetic feed server with each number of workers.
+
+Usage: python benchmarks/parse_pool.py [--feeds 200] [--entries 100] [--summary-bytes 1000] [--workers 0,4]
+       [--runs 3] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+from feed_server import FeedServer
+from run_suite import run, write_config, write_feedinfo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--feeds",type=int,default=200)
+    parser.add_argument("--entries",type=int,default=100)
+    parser.add_argument("--summary-bytes",type=int,default=1000)
+    parser.add_argument("--workers",default=f"0,{os.cpu_count() or 1}",help="Comma separated parse_workers values to compare.")
+    parser.add_argument("--runs",type=int,default=3)
+    parser.add_argument("--json",action="store_true",help="Print the results as json.")
+    args = parser.parse_args()
+
+    server = FeedServer(0,args.feeds,args.entries,args.summary_bytes).start()
+    results = {"cpus":os.cpu_count(),"feeds":args.feeds,"entries":args.entries,"workers":{}}
+    try:
+        for workers in [int(w) for w in args.workers.split(",")]:
+            with tempfile.TemporaryDirectory() as tmp:
+                write_config(tmp,{"parse_workers":workers})
+                write_feedinfo(tmp,server)
+                run(["update"],tmp,server) #Fills the cache, so every measured run saves the same entries.
+                runs = [run(["update","-r"],tmp,server) for _ in range(args.runs)]
+            failed = [r for r in runs if r["returncode"] != 0]
+            results["workers"][workers] = {
+                "median_wall_s":round(statistics.median(r["wall_s"] for r in runs),4),
+                "runs":[r["wall_s"] for r in runs],
+                "errors":[r["error"] for r in failed]
+            }
+    finally:
+        server.stop()
+
+    base = next(iter(results["workers"].values()))["median_wall_s"]
+    for r in results["workers"].values():
+        r["speedup"] = round(base / r["median_wall_s"],2) if r["median_wall_s"] > 0 else None
+    if args.json:
+        print(json.dumps(results,indent=4))
+    else:
+        print(f"{args.feeds} feeds of {args.entries} entries, {results['cpus']} CPU(s)")
+        for workers,r in results["workers"].items():
+            errors = f" ({len(r['errors'])} failed run(s))" if r["errors"] else ""
+            print(f"parse_workers {workers:3}: {r['median_wall_s']:8.3f}s ({r['speedup']}x){errors}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Runs TermRSS commands against a local synthetic feed server and reports wall time, CPU time and peak
+memory of each one as json, so results can be compared between commits.
+
+Usage: python benchmarks/run_suite.py [--feeds 100] [--entries 50] [--summary-bytes 500] [--latency-ms 0]
+       [--error-every 0] [--no-conditional] [--gzip] [--output results.json] [--compare old.json] [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+from feed_server import FeedServer
+
+TERMRSS = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","termrss.py")
+
+
+def write_config(path,extra={}):
+    config = dict({"enable_color_output":False,"verbose_mode":False},**extra)
+    with open(os.path.join(path,"config.json"),"w") as f:
+        f.write(json.dumps(config))
+
+
+def write_feedinfo(path,server):
+    """Subscribes the working directory to every feed of the server, as if they had just been imported."""
+    feeds = {}
+    for n in range(server.feeds):
+        feeds[f"FEED {n}"] = {
+            "url":server.url(n),
+            "last_check":"1960-01-01 00:00:00",
+            "last_read":"1960-01-01 00:00:00",
+            "categories":["bench"],
+            "etag":"",
+            "last-modified":"",
+            "unread":0,
+            "valid":True
+        }
+    with open(os.path.join(path,"feedinfo.json"),"w") as f:
+        f.write(json.dumps(feeds,indent=4))
+
+
+def make_due(path):
+    """Moves the next check of every feed to the past, so the next update fetches all of them."""
+    with open(os.path.join(path,"feedinfo.json")) as f:
+        feeds = json.loads(f.read())
+    for feed in feeds.values():
+        feed["next_check"] = "1960-01-01 00:00:00"
+    with open(os.path.join(path,"feedinfo.json"),"w") as f:
+        f.write(json.dumps(feeds,indent=4))
+
+
+def run(args,cwd,server):
+    """Runs a TermRSS command and measures it.
+
+    Returns:
+        dictionary: Wall and CPU seconds, peak resident memory in KB, exit code and the requests
+        the server received while it ran.
+    """
+    before = server.stats()
+    start = time.perf_counter()
+    proc = sp.Popen([sys.executable,TERMRSS] + args,cwd=cwd,stdin=sp.DEVNULL,stdout=sp.DEVNULL,stderr=sp.PIPE)
+    stderr = proc.stderr.read()
+    _,status,usage = os.wait4(proc.pid,0)
+    wall = time.perf_counter() - start
+    after = server.stats()
+    result = {
+        "wall_s":round(wall,4),
+        "cpu_s":round(usage.ru_utime + usage.ru_stime,4),
+        "max_rss_kb":usage.ru_maxrss,
+        "returncode":os.waitstatus_to_exitcode(status),
+        "requests":after["requests"] - before["requests"],
+        "not_modified":after["not_modified"] - before["not_modified"],
+        "bytes_received":after["bytes_sent"] - before["bytes_sent"],
+        "connections":after["connections"] - before["connections"]
+    }
+    proc.returncode = result["returncode"]
+    if result["returncode"] != 0:
+        result["error"] = stderr.decode("utf-8","replace").strip().splitlines()[-1:]
+    return result
+
+
+def compare(results,baseline,tolerance):
+    """Prints the change of every measure against an older result file. Returns False if any command got
+    slower than the tolerance allows."""
+    ok = True
+    for name,r in results["commands"].items():
+        old = baseline["commands"].get(name)
+        if old == None or old["wall_s"] == 0:
+            continue
+        ratio = r["wall_s"] / old["wall_s"]
+        regressed = ratio > 1 + tolerance
+        ok = ok and regressed == False
+        print(f"{name:14} wall {old['wall_s']:.3f}s -> {r['wall_s']:.3f}s ({ratio:.2f}x){' REGRESSION' if regressed else ''}",file=sys.stderr)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--feeds",type=int,default=100)
+    parser.add_argument("--entries",type=int,default=50)
+    parser.add_argument("--summary-bytes",type=int,default=500)
+    parser.add_argument("--latency-ms",type=int,default=0)
+    parser.add_argument("--error-every",type=int,default=0)
+    parser.add_argument("--no-conditional",action="store_true",help="Ignore ETag and Last-Modified, always answering 200.")
+    parser.add_argument("--gzip",action="store_true",help="Send the feeds gzipped.")
+    parser.add_argument("--output",help="Also write the results to this file.")
+    parser.add_argument("--compare",help="Result file of an earlier run to compare with.")
+    parser.add_argument("--tolerance",type=float,default=0.2,help="Allowed slowdown against --compare before failing.")
+    args = parser.parse_args()
+
+    server = FeedServer(0,args.feeds,args.entries,args.summary_bytes,args.latency_ms,args.error_every,
+                        args.no_conditional == False,0,args.gzip).start()
+    commands = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            #The import runs on its own directory; the other commands start from a prepared feed list.
+            importdir = os.path.join(tmp,"import")
+            os.mkdir(importdir)
+            write_config(importdir)
+            opml = os.path.join(importdir,"feeds.opml")
+            with open(opml,"wb") as f:
+                f.write(server.opml())
+            commands["import"] = run(["import","-u",opml,"-y","--bozo","accept"],importdir,server)
+
+            workdir = os.path.join(tmp,"work")
+            os.mkdir(workdir)
+            write_config(workdir)
+            write_feedinfo(workdir,server)
+            commands["update"] = run(["update"],workdir,server)
+            make_due(workdir)
+            commands["update (again)"] = run(["update"],workdir,server)
+            commands["update -r"] = run(["update","-r"],workdir,server)
+            commands["read -a"] = run(["read","-a"],workdir,server)
+            commands["show"] = run(["show"],workdir,server)
+            cache = os.path.join(workdir,"rsscache.db")
+            cache_size = os.path.getsize(cache) if os.path.isfile(cache) else 0
+    finally:
+        server.stop()
+
+    commit = sp.run(["git","rev-parse","--short","HEAD"],cwd=os.path.dirname(TERMRSS),stdout=sp.PIPE,stderr=sp.DEVNULL,text=True).stdout.strip()
+    results = {
+        "commit":commit,
+        "timestamp":time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python":sys.version.split()[0],
+        "parameters":{k:v for k,v in vars(args).items() if k not in ("output","compare","tolerance")},
+        "cache_bytes":cache_size,
+        "commands":commands
+    }
+    text = json.dumps(results,indent=4)
+    print(text)
+    if args.output:
+        with open(args.output,"w") as f:
+            f.write(text)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.loads(f.read())
+        if compare(results,baseline,args.tolerance) == False:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
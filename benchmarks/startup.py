@@ -0,0 +1,126 @@
+"""Measures how long TermRSS takes to start for the commands that should be fast, and fails if they
+import a heavy dependency or, when compared with a recorded baseline, got slower than it.
+
+Record a baseline on the commit to compare against, then check the change on the same machine:
+
+    python benchmarks/startup.py --record startup.json
+    python benchmarks/startup.py --baseline startup.json
+
+Usage: python benchmarks/startup.py [--runs N] [--feeds N] [--record FILE] [--baseline FILE]
+       [--tolerance 0.25] [--slack-ms MS] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+TERMRSS = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","termrss.py")
+#Modules that must never be imported by the commands below.
+HEAVY_MODULES = ("feedparser","listparser","bs4","dbus")
+COMMANDS = (["show"],["clear"],["status"],["stop"])
+
+
+def write_workdir(path,feeds):
+    """Creates the config and feedinfo files of a TermRSS working directory with the indicated number of feeds."""
+    config = {"enable_color_output":False,"verbose_mode":False}
+    with open(os.path.join(path,"config.json"),"w") as f:
+        f.write(json.dumps(config))
+    info = {}
+    for i in range(feeds):
+        info[f"FEED {i}"] = {
+            "url":f"http://localhost/feed{i}.xml",
+            "last_check":"1960-01-01 00:00:00",
+            "last_read":"1960-01-01 00:00:00",
+            "categories":["bench"],
+            "etag":"",
+            "last-modified":"",
+            "unread":0,
+            "valid":True
+        }
+    with open(os.path.join(path,"feedinfo.json"),"w") as f:
+        f.write(json.dumps(info,indent=4))
+
+
+def time_command(argv,cwd,runs):
+    """Returns the wall time in milliseconds of each run of a command. A first run that isn't measured
+    writes the bytecode caches, so every measured run starts the same way."""
+    sp.run(argv,cwd=cwd,stdout=sp.DEVNULL,stderr=sp.DEVNULL,check=False)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        sp.run(argv,cwd=cwd,stdout=sp.DEVNULL,stderr=sp.DEVNULL,check=False)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def imported_modules(argv,cwd):
+    """Returns the top level names of every module imported by a command, using -X importtime."""
+    result = sp.run([argv[0],"-X","importtime"] + argv[1:],cwd=cwd,stdout=sp.DEVNULL,stderr=sp.PIPE,text=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|",1)[1].strip().split(".")[0])
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs",type=int,default=10)
+    parser.add_argument("--feeds",type=int,default=200)
+    parser.add_argument("--record",help="Save the results to this file, to use as a baseline later.")
+    parser.add_argument("--baseline",help="Fail if a command got slower than on this recorded baseline.")
+    parser.add_argument("--tolerance",type=float,default=0.25,help="Allowed growth of the overhead over the baseline, as a fraction.")
+    parser.add_argument("--slack-ms",type=float,default=10,help="Allowed growth of the overhead over the baseline, in milliseconds.")
+    parser.add_argument("--json",action="store_true",help="Print the results as json.")
+    args = parser.parse_args()
+
+    recorded = {}
+    if args.baseline != None:
+        with open(args.baseline) as f:
+            recorded = json.loads(f.read())["commands"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_workdir(tmp,args.feeds)
+        baseline = statistics.median(time_command([sys.executable,"-c","pass"],tmp,args.runs))
+        results = {"baseline_ms":round(baseline,1),"commands":{}}
+        failed = False
+        for command in COMMANDS:
+            name = " ".join(command)
+            argv = [sys.executable,TERMRSS] + command
+            median = statistics.median(time_command(argv,tmp,args.runs))
+            heavy = sorted(m for m in imported_modules(argv,tmp) if m in HEAVY_MODULES)
+            #Overheads over a bare interpreter are compared, so a busier machine doesn't fail the check.
+            overhead = median - baseline
+            allowed = None
+            if name in recorded:
+                allowed = recorded[name]["overhead_ms"] * (1 + args.tolerance) + args.slack_ms
+            ok = len(heavy) == 0 and (allowed == None or overhead <= allowed)
+            failed = failed or ok == False
+            results["commands"][name] = {
+                "median_ms":round(median,1),
+                "overhead_ms":round(overhead,1),
+                "allowed_overhead_ms":round(allowed,1) if allowed != None else None,
+                "heavy_imports":heavy,
+                "ok":ok
+            }
+    if args.record != None:
+        with open(args.record,"w") as f:
+            f.write(json.dumps(results,indent=4))
+    if args.json:
+        print(json.dumps(results,indent=4))
+    else:
+        print(f"Bare interpreter: {results['baseline_ms']} ms")
+        for name,r in results["commands"].items():
+            status = "ok" if r["ok"] else "FAIL"
+            heavy = f" imports {', '.join(r['heavy_imports'])}" if r["heavy_imports"] else ""
+            allowed = f", allowed +{r['allowed_overhead_ms']:.1f} ms" if r["allowed_overhead_ms"] != None else ""
+            print(f"{name:8} {r['median_ms']:8.1f} ms (+{r['overhead_ms']:.1f} ms{allowed}){heavy} [{status}]")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
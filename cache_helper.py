@@ -1,26 +1,375 @@
+import heapq
 import json
+import math
 import os
-import subprocess as sp
+import socket
+import threading
 import time
+import zlib
 from datetime import datetime
 
-import feedparser
-
+from entry_helper import CACHE_VERSION, compact_entry, compact_feed, compact_result, entry_digest, entry_id, entry_timestamp, index_terms, known_entry_offset, newest_first, tokenize
 from output_helper import OutputHelper
 
+#Version of the database schema, saved as its user_version. Older databases are migrated when opened.
+SCHEMA_VERSION = 3
+
+#How many of the newest entries of a feed are remembered to stop incremental parses at.
+HEAD_SIZE = 3
+
+#Newest entries first. Entries without a date are placed at the time they were first saved.
+ENTRY_ORDER = "ORDER BY COALESCE(published,added) DESC, position"
+
+#Read state of the entries on the seen_entries table. UNKNOWN is used for entries cached before it existed.
+UNREAD = 0
+READ = 1
+UNKNOWN = -1
+
+#Digests kept per feed. Enough to recognize entries long after they left the archive.
+MAX_SEEN_DIGESTS = 5000
+
+#Postings read for a word of a search. Words in more entries only add to the score of the entries found
+#by rarer words, or if every word is that common, of their entries where the word appears most.
+MAX_TERM_POSTINGS = 2000
+
+#Ids looked up in a single query, below SQLite's limit of variables.
+BATCH_SIZE = 500
+
+
+def parse_response(response):
+    """Parses a response downloaded by FetchHelper.get. Defined at module level so it can run on a parse
+    worker process.
+
+    Args:
+        response (dictionary): The response returned by FetchHelper.get.
+
+    Returns:
+        dictionary: The compact result (see entry_helper.compact_result).
+    """
+    if response["status"] == 304 or response["status"] >= 400:
+        raw = {} #Nothing to parse.
+    else:
+        import feedparser
+        headers = dict(response["headers"])
+        headers.setdefault("content-location",response["href"]) #Relative links are resolved against it.
+        raw = dict(feedparser.parse(response["body"],response_headers=headers))
+    raw["status"] = response["status"]
+    raw["href"] = response["href"]
+    raw["etag"] = response["headers"].get("etag","")
+    raw["modified"] = response["headers"].get("last-modified","")
+    raw["headers"] = response["headers"]
+    return compact_result(raw)
+
 
 class CacheHelper():
-    def __init__(self,output_helper,config):
-        """Handles loading and saving to and from the rsscache.json file and keeping the data up to date.
+    def __init__(self,output_helper,config,scheduler_helper,notify_helper,fetch_helper):
+        """Handles loading and saving to and from the rsscache.db file and keeping the data up to date.
+        The cache is a SQLite database with one row per feed and one row per entry, so reading or
+        updating a feed only touches that feed's rows. Only the fields TermRSS uses are saved, optionally
+        compressed, and each feed record has a version so older records are upgraded when loaded. The
+        words of every entry are kept in a postings table, an inverted index used by search.
+
+        Each feed is an archive: new fetches are merged into the entries already saved, and entries that
+        leave the server's feed are kept until the archive_max_entries, archive_max_bytes and
+        archive_max_days limits remove them. A digest of every entry ever seen is kept with its read
+        state, so new and unread entries are found by their identity instead of their date.
 
         Args:
             output_helper (OutputHelper object): An initialized OutputHelper instance. Used to print 
             status messages.
             config (object): A json object parsing the config.json file. 
+            scheduler_helper (SchedulerHelper object): An initialized SchedulerHelper instance. Used to
+            decide when each feed should be fetched.
+            notify_helper (NotifyHelper object): An initialized NotifyHelper instance. Collects the
+            results shown as desktop notifications.
+            fetch_helper (FetchHelper object): An initialized FetchHelper instance. Downloads the feeds
+            unless fetch_backend is "feedparser".
         """
         self.output = output_helper
         self.config = config
+        self.scheduler = scheduler_helper
+        self.notify = notify_helper
+        self.fetcher = fetch_helper
         self.verbose = config["verbose_mode"]
+        self.path = 'rsscache.db'
+        self.connection = None
+        self.pool = None
+        self.pool_closed = False
+        self.pool_lock = threading.Lock()
+
+    @property
+    def db(self):
+        """Opens the cache database the first time it's needed, creating the tables if they don't exist.
+        If there's a cache file from an older version and no database yet, it's migrated automatically."""
+        if self.connection == None:
+            import sqlite3
+            exists = os.path.isfile(self.path)
+            if self.verbose:print("Opening cache database")
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            with self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS feeds (name TEXT PRIMARY KEY, data TEXT NOT NULL)")
+                self.connection.execute("CREATE TABLE IF NOT EXISTS entries (feed TEXT NOT NULL, id TEXT NOT NULL, position INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (feed,id))")
+            self.migrate_schema()
+            if exists == False and os.path.isfile('rsscache.json'):
+                self.output.write_info("Found an old rsscache.json file. Migrating it to rsscache.db...")
+                self.migrate_json_cache('rsscache.json')
+        return self.connection
+
+    def migrate_schema(self):
+        """Brings a database created by an older version up to SCHEMA_VERSION."""
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1: #Search index.
+            if self.verbose:print("Building search index")
+            with self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, feed TEXT NOT NULL, id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term,feed,id)) WITHOUT ROWID")
+                self.connection.execute("CREATE INDEX IF NOT EXISTS postings_entry ON postings (feed,id)")
+                for feed,id,data in self.connection.execute("SELECT feed,id,data FROM entries").fetchall():
+                    self.index_entries(feed,[(id,self.decode(data))])
+                self.connection.execute("PRAGMA user_version = 1")
+        if version < 2: #Entry archive.
+            if self.verbose:print("Adding archive columns")
+            now = time.time()
+            with self.connection:
+                self.connection.execute("ALTER TABLE entries ADD COLUMN published REAL")
+                self.connection.execute("ALTER TABLE entries ADD COLUMN added REAL NOT NULL DEFAULT 0")
+                self.connection.execute("ALTER TABLE entries ADD COLUMN seen REAL NOT NULL DEFAULT 0")
+                self.connection.execute("ALTER TABLE entries ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                self.connection.execute("UPDATE entries SET added = ?, seen = ?, size = LENGTH(data)",(now,now))
+                rows = self.connection.execute("SELECT feed,id,data FROM entries").fetchall()
+                self.connection.executemany("UPDATE entries SET published = ? WHERE feed = ? AND id = ?",[(entry_timestamp(self.decode(data)),feed,id) for feed,id,data in rows])
+                self.connection.execute("DROP INDEX IF EXISTS entries_position")
+                self.connection.execute("CREATE INDEX IF NOT EXISTS entries_order ON entries (feed,COALESCE(published,added))")
+                self.connection.execute("PRAGMA user_version = 2")
+        if version < 3: #Seen entries.
+            if self.verbose:print("Adding seen entries")
+            with self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS seen_entries (feed TEXT NOT NULL, digest INTEGER NOT NULL, state INTEGER NOT NULL, added REAL NOT NULL, PRIMARY KEY (feed,digest)) WITHOUT ROWID")
+                rows = self.connection.execute("SELECT feed,id,added FROM entries").fetchall()
+                self.connection.executemany("INSERT OR IGNORE INTO seen_entries (feed,digest,state,added) VALUES (?,?,?,?)",[(feed,entry_digest(id),UNKNOWN,added) for feed,id,added in rows])
+                self.connection.execute("PRAGMA user_version = 3")
+
+    def encode(self,record):
+        """Serializes a cache record. Compressed with zlib when compress_cache is enabled."""
+        data = json.dumps(record,separators=(',',':'),default=str)
+        if self.config["compress_cache"]:
+            return zlib.compress(data.encode('utf-8'))
+        return data
+
+    def decode(self,data):
+        """Loads a cache record saved by encode, compressed or not."""
+        if isinstance(data,bytes):
+            data = zlib.decompress(data).decode('utf-8')
+        return json.loads(data)
+
+    def write_feed(self,feedname,feed_content,state=UNREAD):
+        """Merges a fetched feed into its archive. Entries that were already saved are updated, new ones
+        are added to the archive and to the search index, and the ones the server no longer sends are
+        kept. If only the new entries were parsed (see parse_new), the known entries the feed still
+        lists are kept as on the server too. Then the retention limits are applied. Must be called inside a transaction.
+
+        Args:
+            feedname (string): Name of the feed.
+            feed_content (object): Feed object to save.
+            state (int, optional): Read state given to entries never seen before. Defaults to UNREAD.
+
+        Returns:
+            int: Number of entries never seen before.
+        """
+        name = feedname.upper()
+        now = time.time()
+        data = {"v":CACHE_VERSION,"feed":compact_feed(feed_content.get("feed",{}))}
+        entries = [(entry_id(e),e) for e in (compact_entry(e) for e in feed_content.get("entries",[]))]
+        rows = []
+        for i,(id,e) in enumerate(entries):
+            encoded = self.encode(e)
+            rows.append((name,id,i,encoded,entry_timestamp(e),now,now,len(encoded)))
+        cached = {}
+        for i in range(0,len(rows),BATCH_SIZE):
+            ids = [r[1] for r in rows[i:i + BATCH_SIZE]]
+            cached.update(self.db.execute(f"SELECT id,data FROM entries WHERE feed = ? AND id IN ({','.join('?' * len(ids))})",[name] + ids))
+        #Entries whose title or summary changed are indexed again, so search finds their new words only.
+        changed = [(name,r[1]) for r in rows if r[1] in cached and cached[r[1]] != r[3]]
+        self.db.executemany("DELETE FROM postings WHERE feed = ? AND id = ?",changed)
+        changed = set(id for _,id in changed)
+        if feed_content.get("partial"):
+            #Only the new entries were parsed, so the known ones still on the server are marked as seen here.
+            self.db.executemany("UPDATE entries SET seen = ? WHERE feed = ? AND id = ?",[(now,name,id) for id in feed_content.get("kept",[])])
+        self.db.execute("INSERT OR REPLACE INTO feeds (name,data) VALUES (?,?)",(name,self.encode(data)))
+        self.db.executemany("INSERT INTO entries (feed,id,position,data,published,added,seen,size) VALUES (?,?,?,?,?,?,?,?) "
+                            "ON CONFLICT (feed,id) DO UPDATE SET position = excluded.position, data = excluded.data, "
+                            "published = excluded.published, seen = excluded.seen, size = excluded.size",rows)
+        self.index_entries(name,[(id,e) for id,e in entries if id not in cached or id in changed])
+        known = set(d for (d,) in self.db.execute("SELECT digest FROM seen_entries WHERE feed = ?",(name,)))
+        new = [d for d in dict.fromkeys(entry_digest(id) for id,_ in entries) if d not in known]
+        self.db.executemany("INSERT INTO seen_entries (feed,digest,state,added) VALUES (?,?,?,?)",[(name,d,state,now) for d in new])
+        self.trim(name)
+        return len(new)
+
+    def unread_states(self,feedname):
+        """Returns the digests of the entries of a feed that haven't been read.
+
+        Args:
+            feedname (string): Name of the feed.
+
+        Returns:
+            dictionary: The state (UNREAD or UNKNOWN) of each digest.
+        """
+        if os.path.isfile(self.path) == False:
+            return {}
+        return dict(self.db.execute("SELECT digest,state FROM seen_entries WHERE feed = ? AND state != ?",(feedname.upper(),READ)))
+
+    def mark_read(self,names):
+        """Marks every entry seen on the indicated feeds as read.
+
+        Args:
+            names (list of strings): Names of the feeds.
+        """
+        if os.path.isfile(self.path) == False:
+            return
+        with self.db:
+            self.db.executemany("UPDATE seen_entries SET state = ? WHERE feed = ? AND state != ?",[(READ,n.upper(),READ) for n in names])
+
+    def mark_entries_read(self,digests):
+        """Marks some entries as read, leaving the rest of their feed as it was.
+
+        Args:
+            digests (dictionary): The digests of the entries to mark (see entry_helper.entry_digest),
+            by feed name.
+        """
+        if os.path.isfile(self.path) == False:
+            return
+        with self.db:
+            self.db.executemany("UPDATE seen_entries SET state = ? WHERE feed = ? AND digest = ?",
+                                [(READ,n.upper(),d) for n,lst in digests.items() for d in lst])
+
+    def trim(self,name):
+        """Removes the entries of a feed that are over the retention limits: archive_max_entries and
+        archive_max_bytes keep only the newest entries, and archive_max_days removes the older ones.
+        Entries still on the server's feed are never removed, but count towards the limits. Must be
+        called inside a transaction.
+
+        Args:
+            name (string): Name of the feed, in uppercase.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        max_entries = self.config["archive_max_entries"]
+        max_bytes = self.config["archive_max_bytes"]
+        max_days = self.config["archive_max_days"]
+        if max_entries == 0 and max_bytes == 0 and max_days == 0:
+            return 0
+        rows = self.db.execute(f"SELECT id,COALESCE(published,added),size,seen FROM entries WHERE feed = ? {ENTRY_ORDER}",(name,)).fetchall()
+        if len(rows) == 0:
+            return 0
+        latest = max(r[3] for r in rows) #When the feed was last saved.
+        cutoff = time.time() - max_days * 86400
+        count = 0
+        total = 0
+        expired = []
+        for id,stamp,size,seen in rows:
+            count += 1
+            total += size
+            if seen >= latest:
+                continue #Still on the server.
+            if (max_entries > 0 and count > max_entries) or (max_bytes > 0 and total > max_bytes) or (max_days > 0 and stamp < cutoff):
+                expired.append((name,id))
+        if len(expired) > 0:
+            if self.verbose:print(f"Removing {len(expired)} old entries of {name}")
+            self.db.executemany("DELETE FROM entries WHERE feed = ? AND id = ?",expired)
+            self.db.executemany("DELETE FROM postings WHERE feed = ? AND id = ?",expired)
+        return len(expired)
+
+    def compact(self,vacuum=False):
+        """Applies the retention limits to every feed, so entries that got too old are removed even if
+        their feed wasn't updated, forgets the oldest digests of feeds with more than MAX_SEEN_DIGESTS,
+        and returns the space of the write-ahead log to the disk.
+
+        Args:
+            vacuum (bool, optional): If True, the database file is also rebuilt to release the space of
+            the removed entries. Slower, and needs as much free disk as the file's size. Defaults to False.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        if os.path.isfile(self.path) == False:
+            return 0
+        removed = 0
+        with self.db:
+            for (name,) in self.db.execute("SELECT name FROM feeds").fetchall():
+                removed += self.trim(name)
+                self.db.execute("DELETE FROM seen_entries WHERE feed = ? AND digest NOT IN (SELECT digest FROM seen_entries WHERE feed = ? ORDER BY added DESC LIMIT ?)",(name,name,MAX_SEEN_DIGESTS))
+        if vacuum:
+            if self.verbose:print("Vacuuming cache database")
+            self.db.execute("VACUUM")
+        self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def index_entries(self,name,entries):
+        """Adds entries to the search index. Must be called inside a transaction.
+
+        Args:
+            name (string): Name of the feed, in uppercase.
+            entries (list of tuples): The id and the compact entry of each entry.
+        """
+        rows = [(term,name,id,tf) for id,e in entries for term,tf in index_terms(e).items()]
+        self.connection.executemany("INSERT OR REPLACE INTO postings (term,feed,id,tf) VALUES (?,?,?,?)",rows)
+
+    def search(self,query,feeds=None,limit=20):
+        """Finds the cached entries that contain the words of a query. Entries with more of the words
+        come first, and between those, the ones where rarer words appear more times (tf-idf). Words in
+        more than MAX_TERM_POSTINGS entries only rank the entries found by the rarer ones.
+
+        Args:
+            query (string): The words to search for.
+            feeds (set of strings, optional): If present, only entries of these feeds are returned. Defaults to None.
+            limit (int, optional): Maximum number of results. Defaults to 20.
+
+        Returns:
+            list of tuples: The feed name and the entry of each result, best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if len(terms) == 0 or os.path.isfile(self.path) == False:
+            return []
+        total = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        where = "term = ?"
+        if feeds != None:
+            with self.db:
+                self.db.execute("CREATE TEMP TABLE IF NOT EXISTS search_feeds (name TEXT PRIMARY KEY)")
+                self.db.execute("DELETE FROM search_feeds")
+                self.db.executemany("INSERT OR IGNORE INTO search_feeds (name) VALUES (?)",[(f,) for f in feeds])
+            where += " AND feed IN (SELECT name FROM search_feeds)"
+        counts = [(self.db.execute(f"SELECT COUNT(*) FROM postings WHERE {where}",(t,)).fetchone()[0],t) for t in terms]
+        scores = {}
+        found = False
+        for count,term in sorted(counts): #Rarest words first.
+            if count == 0:
+                continue
+            idf = math.log(1 + total / count)
+            if len(scores) == 0:
+                postings = self.db.execute(f"SELECT feed,id,tf FROM postings WHERE {where} ORDER BY tf DESC LIMIT ?",(term,MAX_TERM_POSTINGS))
+            elif count <= MAX_TERM_POSTINGS:
+                postings = self.db.execute(f"SELECT feed,id,tf FROM postings WHERE {where}",(term,))
+            else: #Too common to read whole, so only the entries already found are scored.
+                if found == False: #Words are sorted, so the entries found don't change after the first common one.
+                    with self.db:
+                        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS search_entries (feed TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (feed,id))")
+                        self.db.execute("DELETE FROM search_entries")
+                        self.db.executemany("INSERT INTO search_entries (feed,id) VALUES (?,?)",scores.keys())
+                    found = True
+                postings = self.db.execute("SELECT p.feed,p.id,p.tf FROM search_entries c CROSS JOIN postings p ON p.term = ? AND p.feed = c.feed AND p.id = c.id",(term,))
+            for feed,id,tf in postings:
+                matched,score = scores.get((feed,id),(0,0))
+                scores[(feed,id)] = (matched + 1,score + (1 + math.log(tf)) * idf)
+        if self.verbose:print(f"{len(scores)} entries match {terms}")
+        results = []
+        for (feed,id),_ in heapq.nlargest(limit,scores.items(),key=lambda x:x[1]):
+            row = self.db.execute("SELECT data FROM entries WHERE feed = ? AND id = ?",(feed,id)).fetchone()
+            if row != None:
+                results.append((feed,self.decode(row[0])))
+        return results
 
     def save_cache_file(self,feedname,feed_content):
         """Tries to update the cached data of the indicated feed. If the cache file doesn't exist,
@@ -29,43 +378,115 @@ class CacheHelper():
         Args:
             feedname (string): Name of the feed to update
             feed_content (object): Feed object to save.
+
+        Returns:
+            int: Number of entries never seen before.
         """
-        if os.path.isfile('rsscache.json'):
-            if self.verbose:print("Cache file exists")
-            with open('rsscache.json') as f:
-                cache = json.loads(f.read())
-        else:
-            if self.verbose:print("Cache file doesn't exist.")
-            cache = {}
-        cache[feedname.upper()] = feed_content
         if self.verbose:print("Writing cache file.")
-        f = open('rsscache.json','w')
-        f.write(json.dumps(cache,default=str,indent=4))
-        f.close()
+        with self.db:
+            return self.write_feed(feedname,feed_content)
+
+    def save_many(self,feeds):
+        """Saves several feeds to the cache in a single transaction.
 
-    def load_from_cache(self,feedname):
+        Args:
+            feeds (dictionary): Feed object to save for each feed name.
+        """
+        if self.verbose:print(f"Writing {len(feeds)} feed(s) to the cache file.")
+        with self.db:
+            for name,content in feeds.items():
+                self.write_feed(name,content)
+
+    def load_from_cache(self,feedname,entries=True):
         """Tries to load the cached data for the indicated feed from the cache file. Will handle errors if
         the cache file is missing or the key can't be found.
 
         Args:
             feedname (string): Name of the feed to load.
+            entries (bool, optional): If False, only the feed data is loaded, without its entries. Defaults to True.
 
         Returns:
             object: Json object with the feed data.
             None: If the file can't be found or there's no data for this feed.
         """
-        try:
-            with open('rsscache.json') as f:
-                if self.verbose:print("Loading from cache")
-                s = json.loads(f.read())[feedname.upper()]
-        except FileNotFoundError:
+        if os.path.isfile(self.path) == False and os.path.isfile('rsscache.json') == False:
             self.output.write_error("Cache file not found! Force an update (termrss.py update -r) to regenerate it.")
             return None
-        except KeyError:
+        if self.verbose:print("Loading from cache")
+        row = self.db.execute("SELECT data FROM feeds WHERE name = ?",(feedname.upper(),)).fetchone()
+        if row == None:
             self.output.write_error(f"Can't find feed {feedname} in cache file. Run update -r to regenerate it.")
             return None
+        s = self.decode(row[0])
+        if s.get("v",1) < CACHE_VERSION:
+            s = self.upgrade_feed(feedname,s)
+        if entries:
+            s["entries"] = list(self.iter_entries(feedname))
         return s
 
+    def iter_entries(self,feedname,since=None,limit=None,offset=0):
+        """Yields the cached entries of a feed one at a time, newest first.
+
+        Args:
+            feedname (string): Name of the feed.
+            since (float, optional): Only yields the entries published (or saved, if they have no date)
+            at or after this unix timestamp. Defaults to None.
+            limit (int, optional): Maximum number of entries. Defaults to None, no limit.
+            offset (int, optional): Number of entries to skip first. Defaults to 0.
+
+        Yields:
+            object: Json object with the entry data.
+        """
+        for _,e in self.entry_rows(feedname,since,limit,offset):
+            yield self.decode(e)
+
+    def iter_newest(self,names,since=None):
+        """Yields the cached entries of several feeds, newest first across all of them. Every feed is
+        read in order by its own cursor and the cursors are merged as entries are taken, so only the
+        entries that are used are read from disk and decoded.
+
+        Args:
+            names (list of strings): Names of the feeds.
+            since (float, optional): Only yields the entries published (or saved, if they have no date)
+            at or after this unix timestamp. Defaults to None.
+
+        Yields:
+            tuple: The name of the feed and the entry.
+        """
+        def stream(name):
+            for t,e in self.entry_rows(name,since):
+                yield t,name,e
+        for _,n,e in heapq.merge(*(stream(n) for n in names),key=lambda row:row[0],reverse=True):
+            yield n,self.decode(e)
+
+    def entry_rows(self,feedname,since=None,limit=None,offset=0):
+        """Returns a cursor over the date and the saved data of a feed's entries, newest first."""
+        query = "SELECT COALESCE(published,added),data FROM entries WHERE feed = ?"
+        args = [feedname.upper()]
+        if since != None:
+            query += " AND COALESCE(published,added) >= ?"
+            args.append(since)
+        query += " " + ENTRY_ORDER
+        if limit != None or offset > 0:
+            query += " LIMIT ? OFFSET ?"
+            args += [limit if limit != None else -1,offset]
+        return self.db.execute(query,args)
+
+    def upgrade_feed(self,feedname,data):
+        """Rewrites a feed saved by an older version of the cache with the current record format.
+
+        Args:
+            feedname (string): Name of the feed.
+            data (object): The old feed record.
+
+        Returns:
+            object: The upgraded feed record, without its entries.
+        """
+        if self.verbose:print(f"Upgrading cache records of {feedname}")
+        data["entries"] = list(self.iter_entries(feedname))
+        with self.db:
+            self.write_feed(feedname,data)
+        return {"v":CACHE_VERSION,"feed":compact_feed(data.get("feed",{}))}
 
     def remove_from_cache(self,feedname):
         """Tries to remove a feed's data from the cache file. Used when the user unsuscribes from a feed.
@@ -73,94 +494,268 @@ class CacheHelper():
         Args:
             feedname (string): Name of the feed.
         """
+        import sqlite3
         try:
-            with open('rsscache.json') as f:
-                cache = json.loads(f.read())
-            if cache[feedname.upper()] != None:
-                cache.pop(feedname.upper())
-                with open('rsscache.json','w') as f:
-                    f.write(json.dumps(cache,indent=4))
-        except Exception as e:
+            with self.db:
+                self.db.execute("DELETE FROM feeds WHERE name = ?",(feedname.upper(),))
+                self.db.execute("DELETE FROM entries WHERE feed = ?",(feedname.upper(),))
+                self.db.execute("DELETE FROM postings WHERE feed = ?",(feedname.upper(),))
+                self.db.execute("DELETE FROM seen_entries WHERE feed = ?",(feedname.upper(),))
+        except sqlite3.Error as e:
             self.output.write_error(e)
+
+    def migrate_json_cache(self,path):
+        """Copies every feed from an rsscache.json file created by older versions into the cache database.
+        The old file is left untouched.
+
+        Args:
+            path (string): Path of the rsscache.json file.
+
+        Returns:
+            int: Number of feeds migrated.
+        """
+        with open(path) as f:
+            cache = json.loads(f.read())
+        with self.db:
+            for name,content in cache.items():
+                if self.verbose:print(f"Migrating {name}")
+                self.write_feed(name,content,UNKNOWN) #Which entries were read is saved on feedinfo.json by date.
+        return len(cache)
    
-    def check_cache_valid(self,name,feed,last_check,to_console,force_refresh):
-        """Checks if has been enough time since the last time the server was called, tries to fetch
-        new data from it if so, and handles the different HTML codes it can receive. Will update feedinfo
-        and rsscache as needed to adjust to changes and updates. Will fail silently if it receives an
-        unknown code.
+    def is_due(self,feed,force_refresh):
+        """Checks if the feed's next scheduled check has already passed.
 
         Args:
-            name (string): Name of the feed to check.
             feed (object): Feed object to get data from.
-            last_check (datetime): Datetime object with the last time the feed was checked for updates.
-            to_console (bool): If True, will print status messages to terminal.
-            force_refresh (bool): If True, will download new data from the server and refresh cache even if
-            there are no changes.
+            force_refresh (bool): If True, the feed is always due.
+
+        Returns:
+            bool: True if the server should be called.
         """
-        etag = feed["etag"]
-        modified = feed["last-modified"]
-        diff = datetime.now() - last_check
-        if diff.total_seconds()/60 < self.config["update_time_minutes"] and force_refresh == False: #If it's still too soon...
+        if self.scheduler.next_check(feed) > datetime.now() and force_refresh == False: #If it's still too soon...
             if self.verbose:print("Update called too soon.")
-            i = feed["unread"]
-            if to_console:
-                print(f"{name}: {i} unread")
+            return False
+        return True
+
+    def report_cached(self,name,feed,to_console):
+        """Reports the unread count of a feed that was not fetched because it was called too soon.
+
+        Args:
+            name (string): Name of the feed.
+            feed (object): Feed object to get data from.
+            to_console (bool): If True, will print status messages to terminal.
+        """
+        i = feed["unread"]
+        if to_console:
+            print(f"{name}: {i} unread")
+        else:
+            self.notify.count(name,i,f"{i} unread")
+
+    def fetch_feed(self,url,etag,modified,force_refresh,digest="",head=[]):
+        """Downloads and parses a feed from the server. Doesn't modify any state, so it's safe to call
+        from a worker thread. Many servers ignore etag and modified and send the same feed every time;
+        if the body is identical to the one of the last fetch, it's not parsed and the result is a 304.
+        If head is given, only the part of the feed before the first of those entries is parsed (see
+        entry_helper.known_entry_offset), unless the new entries turn out not to be ordered by date.
+
+        Args:
+            url (string): Url of the feed.
+            etag (string): Etag saved from the last fetch.
+            modified (string): Last-Modified value saved from the last fetch.
+            force_refresh (bool): If True, will ignore etag, modified and digest and download and parse
+            the full feed.
+            digest (string, optional): Digest of the body of the last fetch. Defaults to "".
+            head (list of ints, optional): Digests of the newest entries of the last fetch. Defaults to
+            [], a full parse.
+
+        Returns:
+            dictionary: The compact result (see entry_helper.compact_result), with the seconds spent
+            on fetch_s and parse_s, the bytes received, the bytes compression saved, the digest of the
+            body and, if it was identical to the last one, unchanged set to True. If only the new entries
+            were parsed, partial is set to True.
+
+        Raises:
+            FetchError: If the server couldn't be reached, took too long or sent too much.
+        """
+        if self.verbose:print(f"Fetching server {url}")
+        if force_refresh:
+            etag = ""
+            modified = ""
+            digest = ""
+            head = []
+        start = time.perf_counter()
+        if self.config["fetch_backend"] == "feedparser" or url.startswith(("http://","https://")) == False:
+            import feedparser
+            #feedparser opens its own connections, which only take the default timeout.
+            socket.setdefaulttimeout(self.config["fetch_read_timeout"])
+            raw = feedparser.parse(url,etag=etag or None,modified=modified or None)
+            fetched = time.perf_counter()
+            result = compact_result(raw)
+            result["fetch_s"] = fetched - start #feedparser downloads and parses in the same call.
+            try:
+                result["bytes"] = int(result["headers"].get("content-length",0))
+            except ValueError:
+                result["bytes"] = 0
+            result["bytes_saved"] = 0
+        else:
+            response = self.fetcher.get(url,etag,modified)
+            fetched = time.perf_counter()
+            if digest != "" and response["status"] in (200,302) and response["digest"] == digest:
+                if self.verbose:print("Same feed as the last fetch, skipping it.")
+                result = parse_response(dict(response,status=304,body=b""))
+                result["unchanged"] = True
             else:
-                if i > 0:
-                    sp.call(['notify-send',name,f"{i} unread"])            
-            return
-        #If not, we proceed:
-        if self.verbose:print("Fetching server")
-        result = feedparser.parse(feed["url"],etag=etag,modified=modified) if force_refresh == False else feedparser.parse(feed["url"])
+                result = self.parse_new(response,head)
+            result["digest"] = response["digest"]
+            result["fetch_s"] = fetched - start
+            result["bytes"] = response["bytes"]
+            result["bytes_saved"] = response["bytes_saved"]
+        result["parse_s"] = time.perf_counter() - fetched
+        return result
+
+    def parse(self,response):
+        """Parses a downloaded feed into a compact result. If parse_workers is set, the parsing runs on a
+        pool of worker processes, so a large update uses every core instead of one; only the body goes
+        to the worker and only the compact result comes back. Safe to call from a worker thread.
+
+        Args:
+            response (dictionary): The response returned by FetchHelper.get.
+
+        Returns:
+            dictionary: The compact result.
+        """
+        if self.config["parse_workers"] <= 0 or len(response["body"]) == 0 or response["status"] == 304 or response["status"] >= 400:
+            return parse_response(response)
+        pool = self.parse_pool()
+        try:
+            if pool != None:
+                return pool.submit(parse_response,response).result()
+        except RuntimeError: #The pool was shut down after it was returned.
+            pass
+        return parse_response(response) #A fetch that finished after its update was over.
+
+    def parse_new(self,response,head):
+        """Parses only the header and the new entries of a downloaded feed: the part before the first
+        entry on head. Falls back to parsing the whole feed if none of those entries is on it, or if the
+        new entries aren't ordered from newest to oldest, since there could be more new entries after
+        the known ones.
 
-        if result.status == 404:
+        Args:
+            response (dictionary): The response returned by FetchHelper.get.
+            head (list of ints): Digests of the newest entries of the last fetch.
+
+        Returns:
+            dictionary: The compact result, with partial set to True if only the new entries were parsed.
+            Then kept has the identifiers of the known entries the feed still lists.
+        """
+        cut = known_entry_offset(response["body"],head) if len(head) > 0 and response["status"] in (200,302) else None
+        if cut != None:
+            offset,closing,kept = cut
+            result = self.parse(dict(response,body=response["body"][:offset] + closing.encode("utf-8")))
+            if result["bozo"] == 0 and (len(result["entries"]) == 0 or newest_first(result["entries"])):
+                if self.verbose:print(f"Parsed {offset} of {len(response['body'])} bytes, {len(result['entries'])} new entries.")
+                result["partial"] = True
+                result["kept"] = kept
+                return result
+            if self.verbose:print("New entries aren't ordered, parsing the whole feed.")
+        return self.parse(response)
+
+    def parse_pool(self):
+        """Returns the pool of parse worker processes, starting it the first time it's needed. The
+        workers are started by a fork server (or spawned where there's none) instead of forking this
+        process, which is running fetch threads. Returns None after close_parse_pool, until
+        open_parse_pool is called, so a fetch left running by an update that's over can't start a pool
+        nothing would stop."""
+        with self.pool_lock:
+            if self.pool_closed:
+                return None
+            if self.pool == None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                if self.verbose:print(f"Starting {self.config['parse_workers']} parse worker(s)")
+                self.pool = ProcessPoolExecutor(max_workers=self.config["parse_workers"],mp_context=multiprocessing.get_context(method))
+            return self.pool
+
+    def close_parse_pool(self):
+        """Stops the parse worker processes, if they were started. Called at the end of every update, so
+        the background updater doesn't keep idle processes between cycles."""
+        with self.pool_lock:
+            self.pool_closed = True
+            if self.pool != None:
+                self.pool.shutdown()
+                self.pool = None
+
+    def open_parse_pool(self):
+        """Lets parse start the pool of parse worker processes again, at the start of an update."""
+        with self.pool_lock:
+            self.pool_closed = False
+
+    def apply_result(self,name,feed,result,to_console):
+        """Handles the different HTML codes a fetch can receive, updating the feed object and the cache
+        as needed. Must be called from the main thread.
+
+        Args:
+            name (string): Name of the feed.
+            feed (object): Feed object to update.
+            result (dictionary): The compact result returned by fetch_feed.
+            to_console (bool): If True, will print status messages to terminal.
+        """
+        self.scheduler.plan(feed,result)
+        if result["status"] == 404:
             if to_console:
                 self.output.write_error("Got an error 404 while trying to fetch this feed. Please check the URL is correct.")
             else:
-                sp.call(['notify-send',name,"[ERROR] Error 404 received when fetching the feed."])
+                self.notify.error(name,"[ERROR] Error 404 received when fetching the feed.")
             return
         
-        if result.status == 410: #Feed deleted.
+        if result["status"] == 410: #Feed deleted.
             if to_console:
                 self.output.write_error("This feed has been deleted from the server and will no longer be fetched. Please run remove to remove it from your list.")
             else:
-                sp.call(['notify-send',name,"[ERROR] This feed has been deleted from the server and will no longer be fetched."])
+                self.notify.error(name,"[ERROR] This feed has been deleted from the server and will no longer be fetched.")
             feed["valid"] = False
             return
 
-        elif result.status == 301: #Permanent redirect
+        elif result["status"] == 301: #Permanent redirect
             if self.verbose:print("Updating url")
-            new_url = result.href
+            new_url = result["href"]
             if to_console:
                 self.output.write_info(f"This feed has been moved! URL has been updated to {new_url}. Please try updating again.")
             feed["url"] = new_url
+            feed["next_check"] = feed["last_check"] #The new url can be fetched right away.
             return
 
-        elif result.status == 304: #No changes
+        elif result["status"] == 304: #No changes
             i = feed["unread"]
             if to_console:
                 print(f"{name}: {i} unread")
             else:
-                sp.call(['notify-send',name,f"{i} unread"])                
+                self.notify.count(name,i,f"{i} unread")
             return
         
-        elif result.status == 200 or result.status == 302: #Either the web updated or it updated and it's a temporary redirect.
-            if self.verbose:print(f"Status {result.status}")
-            etag = result.etag if hasattr(result,'etag') else ""
-            modified = result.modified if hasattr(result,'modified') else ""
-            feed["etag"] = etag
-            feed["last-modified"] = modified
-            i = feed["unread"]
-            for e in result.entries:
-                if self.verbose:print("Checking for new entries")
-                p_date = datetime.fromtimestamp(time.mktime(e.published_parsed))
-                if p_date > last_check: #If newer.
-                    i = i+1
+        elif result["status"] == 200 or result["status"] == 302: #Either the web updated or it updated and it's a temporary redirect.
+            if self.verbose:print(f"Status {result['status']}")
+            feed["etag"] = result["etag"]
+            feed["last-modified"] = result["modified"]
+            feed["digest"] = result.get("digest","")
+            if self.config["incremental_parse"]:
+                if result.get("partial") != True:
+                    feed["ordered"] = newest_first(result["entries"])
+                new = [entry_digest(entry_id(e)) for e in result["entries"][:HEAD_SIZE]]
+                feed["head"] = list(dict.fromkeys(new + feed.get("head",[])))[:HEAD_SIZE]
+            i = feed["unread"] + self.save_cache_file(name,result) #Entries never seen before.
             if to_console:
                 print(f"{name}: {i} update(s)")
             else:
-                if i > 0:
-                    sp.call(['notify-send',name,f"{i} updates(s)"])      
-            feed["unread"] = i     
-            self.save_cache_file(name,result)
+                self.notify.count(name,i,f"{i} update(s)")
+            feed["unread"] = i
+            return
+
+        elif result["status"] == None or result["status"] >= 400: #Any other error, or no answer at all.
+            reason = f"error {result['status']}" if result["status"] != None else result["bozo_exception"] or "no response"
+            if to_console:
+                self.output.write_error(f"Couldn't fetch {name} ({reason}).")
+            else:
+                self.notify.error(name,f"[ERROR] Couldn't fetch the feed ({reason}).")
             return
@@ -0,0 +1,128 @@
+def normalize_categories(categories):
+    """Returns the categories of a feed as a list of unique, lowercase names, whatever form they were saved
+    or received in: a comma separated string, a list of strings, or a list of category paths as returned
+    by listparser.
+
+    Args:
+        categories (string, list or None): The categories to normalize.
+
+    Returns:
+        list of strings: The normalized categories, in their original order.
+    """
+    if categories == None:
+        return []
+    if isinstance(categories,str):
+        categories = categories.split(",")
+    result = []
+    for c in categories:
+        for item in (c if isinstance(c,(list,tuple)) else [c]):
+            item = str(item).strip().lower()
+            if item != "" and item not in result:
+                result.append(item)
+    return result
+
+
+def parse_query(query):
+    """Parses a category query. Terms separated by commas are joined with OR, categories joined with '+'
+    must all be present (AND), and a category starting with '!' must not be present (NOT). For example,
+    "tech+!linux,news" selects the feeds in tech but not in linux, and every feed in news.
+
+    Args:
+        query (string or list of strings): The query. A list is read as its items separated by commas.
+
+    Returns:
+        list of tuples: One (included, excluded) pair of category lists for each OR term.
+    """
+    if query == None:
+        return []
+    if isinstance(query,(list,tuple)):
+        query = ",".join(query)
+    groups = []
+    for term in query.split(","):
+        included = []
+        excluded = []
+        for c in term.split("+"):
+            c = c.strip().lower()
+            if c.startswith("!"):
+                c = c[1:].strip()
+                if c != "":
+                    excluded.append(c)
+            elif c != "":
+                included.append(c)
+        if len(included) > 0 or len(excluded) > 0:
+            groups.append((included,excluded))
+    return groups
+
+
+class CategoryHelper():
+    def __init__(self,config):
+        """Keeps an index from each category to the names of the feeds in it, so category filters are
+        answered with set operations instead of going through every feed. The index is built from the
+        feed list the first time it's needed and kept in sync by add and remove afterwards.
+
+        Args:
+            config (object): A json object parsing the config.json file.
+        """
+        self.config = config
+        self.verbose = config["verbose_mode"]
+        self.index = None
+
+    def build(self,feeds):
+        """Builds the index from the feed list. Categories saved by older versions, as a single string or
+        with different case, are normalized in place.
+
+        Args:
+            feeds (dictionary): The feeds saved on feedinfo.json.
+        """
+        if self.verbose:print("Building category index")
+        self.index = {}
+        for name,feed in feeds.items():
+            feed["categories"] = normalize_categories(feed.get("categories"))
+            for c in feed["categories"]:
+                self.index.setdefault(c,set()).add(name)
+
+    def add(self,name,categories):
+        """Adds a feed to the index. Does nothing if the index hasn't been built yet."""
+        if self.index == None:
+            return
+        for c in categories:
+            self.index.setdefault(c,set()).add(name)
+
+    def remove(self,name,categories):
+        """Removes a feed from the index. Does nothing if the index hasn't been built yet."""
+        if self.index == None:
+            return
+        for c in categories:
+            names = self.index.get(c)
+            if names != None:
+                names.discard(name)
+                if len(names) == 0:
+                    self.index.pop(c)
+
+    def select(self,feeds,query):
+        """Returns the names of the feeds that match a category query (see parse_query).
+
+        Args:
+            feeds (dictionary): The feeds saved on feedinfo.json.
+            query (string or list of strings): The category query. If it's empty, every feed matches.
+
+        Returns:
+            list of strings: Names of the matching feeds, in the order they're saved.
+        """
+        groups = parse_query(query)
+        if len(groups) == 0:
+            return list(feeds)
+        if self.index == None:
+            self.build(feeds)
+        selected = set()
+        for included,excluded in groups:
+            if len(included) > 0:
+                sets = sorted((self.index.get(c,set()) for c in included),key=len)
+                match = set(sets[0]).intersection(*sets[1:])
+            else:
+                match = set(feeds)
+            for c in excluded:
+                match -= self.index.get(c,set())
+            selected |= match
+        if self.verbose:print(f"{len(selected)} feed(s) match the categories.")
+        return [n for n in feeds if n in selected]
@@ -0,0 +1,121 @@
+import json
+import os
+import socket
+
+
+class UpdaterBusy(Exception):
+    """Raised when the background updater is running but doesn't answer a command in time."""
+
+
+class DaemonHelper():
+    def __init__(self,output_helper,config,path='rssclient.sock'):
+        """Handles the control socket of the background updater. The updater listens on a Unix domain
+        socket, and the other commands send it small json messages (reload, update, clear, status, stop)
+        instead of restarting it.
+
+        Args:
+            output_helper (OutputHelper object): An initialized OutputHelper instance. Used to print
+            status messages.
+            config (object): A json object parsing the config.json file.
+            path (string, optional): Path of the socket file. Defaults to 'rssclient.sock'.
+        """
+        self.output = output_helper
+        self.config = config
+        self.verbose = config["verbose_mode"]
+        self.path = path
+        self.running = False
+        self.server = None
+        self.handle = None
+
+    def send(self,command,timeout=5,**args):
+        """Sends a command to the background updater and waits for its answer.
+
+        Args:
+            command (string): Name of the command.
+            timeout (int, optional): Seconds to wait for an answer. Defaults to 5.
+            **args: Arguments of the command. Must be json serializable.
+
+        Returns:
+            dictionary: The answer of the updater.
+            None: If the updater is not running.
+
+        Raises:
+            UpdaterBusy: If the updater is running but didn't answer.
+        """
+        request = dict(args,command=command)
+        try:
+            with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as s:
+                s.settimeout(timeout)
+                s.connect(self.path)
+                s.sendall(json.dumps(request).encode('utf-8') + b"\n")
+                answer = self.read_message(s)
+        except (FileNotFoundError,ConnectionRefusedError):
+            return None
+        except socket.timeout:
+            raise UpdaterBusy(f"The background updater is busy and didn't answer in {timeout} seconds. Try again in a moment.")
+        except (OSError,ValueError) as e:
+            raise UpdaterBusy(f"The background updater didn't answer: {e}")
+        if self.verbose:print(f"Updater answered {answer}")
+        return answer
+
+    def read_message(self,conn):
+        """Reads a single json message, terminated by a newline, from a socket."""
+        data = b""
+        while b"\n" not in data:
+            chunk = conn.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return json.loads(data.decode('utf-8'))
+
+    def serve(self,handle,tick):
+        """Runs the updater loop: answers the commands received on the socket and calls tick about once
+        per second. Returns after handle sets self.running to False. Long ticks should call poll now and
+        then, so commands are still answered while they run.
+
+        Args:
+            handle (function): Called with each request dictionary. Returns the answer dictionary.
+            tick (function): Called on every iteration of the loop. Used to run scheduled updates.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path) #Left behind by an updater that didn't stop cleanly.
+        self.server = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen()
+        self.handle = handle
+        self.running = True
+        try:
+            while self.running:
+                tick()
+                self.poll(1)
+        finally:
+            self.server.close()
+            self.server = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def poll(self,timeout=0):
+        """Answers the commands waiting on the socket. Does nothing if the updater isn't serving.
+
+        Args:
+            timeout (int, optional): Seconds to wait for the first command. Defaults to 0.
+        """
+        if self.server == None:
+            return
+        self.server.settimeout(timeout)
+        while True:
+            try:
+                conn,_ = self.server.accept()
+            except (socket.timeout,BlockingIOError):
+                return
+            with conn:
+                conn.settimeout(5)
+                try:
+                    answer = self.handle(self.read_message(conn))
+                except Exception as e:
+                    answer = {"ok":False,"error":str(e)}
+                try:
+                    conn.sendall(json.dumps(answer).encode('utf-8') + b"\n")
+                except OSError:
+                    pass
+            self.server.settimeout(0)
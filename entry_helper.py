@@ -0,0 +1,293 @@
+import calendar
+import hashlib
+import html
+import re
+from html.parser import HTMLParser
+
+#Version of the records saved in the cache. Records from older versions are upgraded when they're loaded.
+CACHE_VERSION = 2
+
+#A word of a text indexed for search.
+WORD = re.compile(r"\w+")
+
+#Bytes given to the streaming parser at a time when looking for known entries.
+SCAN_CHUNK = 65536
+
+
+class TextExtractor(HTMLParser):
+    """Collects the text of an html fragment without its markup, like BeautifulSoup's get_text does:
+    character references are resolved, CDATA sections are kept, and comments and the contents of
+    script, style and template elements are left out."""
+    SKIPPED = ("script","style","template")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self,tag,attrs):
+        if tag in self.SKIPPED:
+            self.skipping += 1
+
+    def handle_endtag(self,tag):
+        if tag in self.SKIPPED and self.skipping > 0:
+            self.skipping -= 1
+
+    def handle_data(self,data):
+        if self.skipping == 0:
+            self.parts.append(data)
+
+    def unknown_decl(self,data):
+        if data.startswith("CDATA[") and self.skipping == 0:
+            self.parts.append(data[6:])
+
+    def text(self):
+        return "".join(self.parts)
+
+
+def entry_id(entry):
+    """Returns a stable identifier for a feed entry, so the same entry can be found again on later fetches.
+    Uses the guid if the feed has one, then the link, and as a last resort a hash of the title and summary.
+
+    Args:
+        entry (dictionary): Entry object as returned by feedparser or loaded from cache.
+
+    Returns:
+        string: The identifier of the entry.
+    """
+    for key in ("id","link"):
+        value = entry.get(key)
+        if value:
+            return str(value)
+    content = f"{entry.get('title','')}\n{entry.get('summary','')}"
+    return "sha1:" + hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def entry_digest(id):
+    """Returns a 64-bit hash of an entry identifier, used to remember which entries were seen and read
+    without keeping the whole identifiers.
+
+    Args:
+        id (string): The identifier returned by entry_id.
+
+    Returns:
+        int: A signed 64-bit integer, so SQLite can store it as is.
+    """
+    return int.from_bytes(hashlib.blake2b(id.encode("utf-8"),digest_size=8).digest(),"big",signed=True)
+
+
+def html_to_text(summary):
+    """Converts the html summary of an entry to plain text. Summaries without markup skip the html
+    parser entirely, and ordinary markup is stripped with the standard library's parser. BeautifulSoup
+    is only used if that parser fails.
+
+    Args:
+        summary (string): Summary of the entry, as sent by the server.
+
+    Returns:
+        string: The text of the summary without any markup.
+    """
+    if summary == None:
+        return ""
+    if "<" not in summary:
+        return html.unescape(summary) if "&" in summary else summary
+    parser = TextExtractor()
+    try:
+        parser.feed(summary)
+        parser.close()
+        return parser.text()
+    except Exception:
+        pass
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(summary,'html.parser').get_text()
+
+
+def entry_timestamp(entry):
+    """Returns when an entry was published as a unix timestamp, or None if the feed didn't say.
+
+    Args:
+        entry (dictionary): A compact entry.
+
+    Returns:
+        float: Seconds since the epoch.
+    """
+    published = entry.get("published_parsed")
+    if not published:
+        return None
+    try:
+        return float(calendar.timegm(tuple(published)))
+    except (TypeError,ValueError,OverflowError):
+        return None
+
+
+def tokenize(text):
+    """Splits a text into the lowercase words used by the search index. Single characters are skipped.
+
+    Args:
+        text (string): The text to split.
+
+    Returns:
+        list of strings: The words, in the order they appear.
+    """
+    return [w for w in WORD.findall(text.lower()) if len(w) > 1]
+
+
+def index_terms(entry):
+    """Returns the words of a compact entry and how many times each one appears. Words in the title count
+    twice, so entries about a word rank above entries that just mention it.
+
+    Args:
+        entry (dictionary): A compact entry.
+
+    Returns:
+        dictionary: The weight of each word.
+    """
+    terms = {}
+    for w in tokenize(entry.get("title") or ""):
+        terms[w] = terms.get(w,0) + 2
+    for w in tokenize(entry.get("summary_text") or ""):
+        terms[w] = terms.get(w,0) + 1
+    return terms
+
+
+def compact_entry(entry):
+    """Returns a copy of an entry with only the fields TermRSS uses.
+
+    Args:
+        entry (dictionary): Entry object as returned by feedparser or loaded from cache.
+
+    Returns:
+        dictionary: The compact entry.
+    """
+    published = entry.get("published_parsed")
+    compact = {
+        "title":entry.get("title",""),
+        "link":entry.get("link",""),
+        "summary":entry.get("summary",""),
+        "summary_text":entry["summary_text"] if "summary_text" in entry else html_to_text(entry.get("summary")),
+        "published":entry.get("published",""),
+        "published_parsed":list(published)[:9] if published else None
+    }
+    if entry.get("id"):
+        compact["id"] = str(entry["id"])
+    return compact
+
+
+def compact_feed(feed):
+    """Returns the fields of a feed's channel that TermRSS uses."""
+    return {"title":feed.get("title",""),"link":feed.get("link",""),"ttl":feed.get("ttl")}
+
+
+def compact_result(result):
+    """Turns a feedparser result into a small dictionary with only the data TermRSS needs, so it's cheap
+    to pass around, save and load.
+
+    Args:
+        result (object): The feedparser result.
+
+    Returns:
+        dictionary: The compact result. Its entries are compact entries.
+    """
+    return {
+        "v":CACHE_VERSION,
+        "status":result.get("status"),
+        "href":result.get("href",""),
+        "etag":result.get("etag",""),
+        "modified":result.get("modified",""),
+        "headers":dict(result.get("headers",{})),
+        "bozo":result.get("bozo",0),
+        "bozo_exception":str(result["bozo_exception"]) if "bozo_exception" in result else "",
+        "feed":compact_feed(result.get("feed",{})),
+        "entries":[compact_entry(e) for e in result.get("entries",[])]
+    }
+
+
+def newest_first(entries):
+    """Checks if a feed lists its entries from newest to oldest, which is needed to stop parsing it at the
+    first entry that was already seen.
+
+    Args:
+        entries (list): Compact entries, in the order of the feed.
+
+    Returns:
+        bool: True if every entry has a date and none is newer than the one before.
+    """
+    dates = [entry_timestamp(e) for e in entries]
+    if len(dates) == 0 or None in dates:
+        return False
+    return all(a >= b for a,b in zip(dates,dates[1:]))
+
+
+def known_entry_offset(body,known):
+    """Reads a feed document with a streaming XML parser to find the first entry that was already seen,
+    and returns where that entry starts. Everything before it is the feed's header and its new entries,
+    so that's all that needs to be parsed. The identifiers of that entry and the ones after it are
+    collected too, since they're the known entries the server still lists. Entries are identified like
+    entry_id does: by their guid, id or rdf:about, or by their link.
+
+    Args:
+        body (bytes): The feed document.
+        known (list of ints): Digests (see entry_digest) of entries already seen.
+
+    Returns:
+        tuple: The byte offset where the first known entry starts, the closing tags of the elements
+        open at that point and the identifiers of the entries from there on, or None if no entry is
+        known or the document can't be read this way.
+    """
+    from xml.parsers import expat
+    known = set(known)
+    if len(known) == 0 or body[:4].count(b"\x00") > 0: #UTF-16 and UTF-32 can't be cut and closed as bytes.
+        return None
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    stack = []
+    item = {}
+    found = []
+    kept = []
+
+    def start(name,attrs):
+        local = name.rpartition(":")[2]
+        if len(item) == 0 and local in ("item","entry"):
+            item.update(start=parser.CurrentByteIndex,depth=len(stack),about=attrs.get("rdf:about"),field=None,text=[])
+        elif len(item) > 0 and len(stack) == item["depth"] + 1:
+            if local in ("guid","id"):
+                item["field"] = "id"
+            elif local == "link" and "href" in attrs:
+                if attrs.get("rel","alternate") == "alternate":
+                    item.setdefault("link",attrs["href"].strip())
+            elif local == "link":
+                item["field"] = "link"
+        stack.append(name)
+
+    def text(data):
+        if len(item) > 0 and item["field"] != None:
+            item["text"].append(data)
+
+    def end(name):
+        stack.pop()
+        if len(item) == 0:
+            return
+        if len(stack) == item["depth"] + 1 and item["field"] != None:
+            item.setdefault(item["field"],"".join(item["text"]).strip())
+            item["field"] = None
+            item["text"] = []
+        elif len(stack) == item["depth"]:
+            id = item.get("id") or item["about"] or item.get("link")
+            if len(found) == 0 and id and entry_digest(id) in known:
+                found.extend((item["start"],"".join(f"</{n}>" for n in reversed(stack))))
+            if len(found) > 0 and id:
+                kept.append(id)
+            item.clear()
+
+    parser.StartElementHandler = start
+    parser.CharacterDataHandler = text
+    parser.EndElementHandler = end
+    try:
+        for i in range(0,len(body),SCAN_CHUNK):
+            parser.Parse(body[i:i + SCAN_CHUNK],False)
+        parser.Parse(b"",True)
+    except expat.ExpatError:
+        return None
+    if len(found) == 0:
+        return None
+    return found[0],found[1],kept
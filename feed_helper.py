@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import time
+
+
+class FeedHelper():
+    def __init__(self,output_helper,config,path='feedinfo.json'):
+        """Handles reading and writing the feedinfo.json file. Writes are skipped when nothing changed
+        since the last one, and are done on a temporary file that is renamed into place, so a crash can
+        never leave a truncated feedinfo.json behind.
+
+        Args:
+            output_helper (OutputHelper object): An initialized OutputHelper instance. Used to print
+            status messages.
+            config (object): A json object parsing the config.json file.
+            path (string, optional): Path of the feedinfo file. Defaults to 'feedinfo.json'.
+        """
+        self.output = output_helper
+        self.config = config
+        self.verbose = config["verbose_mode"]
+        self.path = path
+        self.saved = None
+        self.pending = False
+        self.last_write = 0
+
+    def load(self):
+        """Reads the feed list from disk.
+
+        Returns:
+            dictionary: The feeds saved on the file.
+
+        Raises:
+            IOError: If the file doesn't exist.
+        """
+        with open(self.path) as f:
+            s = f.read()
+        feeds = json.loads(s)
+        self.saved = s #Files written by save compare equal to their own contents.
+        return feeds
+
+    def changes(self,feeds):
+        """Returns what changed on the feed list since it was loaded or last written, so it can be sent
+        to the background updater.
+
+        Args:
+            feeds (dictionary): The feeds in memory.
+
+        Returns:
+            dictionary: feeds has the values that changed on each feed (every value, for new feeds),
+            unset the keys removed from each feed, and removed the names of the feeds that were removed.
+            None if nothing changed.
+        """
+        base = json.loads(self.saved) if self.saved != None else {}
+        changed = {}
+        unset = {}
+        for name,feed in feeds.items():
+            old = base.get(name,{})
+            values = {k:v for k,v in feed.items() if k not in old or old[k] != v}
+            keys = [k for k in old if k not in feed]
+            if len(values) > 0:
+                changed[name] = values
+            if len(keys) > 0:
+                unset[name] = keys
+        removed = [n for n in base if n not in feeds]
+        if len(changed) == 0 and len(unset) == 0 and len(removed) == 0:
+            return None
+        return {"feeds":changed,"unset":unset,"removed":removed}
+
+    def synced(self,feeds):
+        """Marks the feed list as saved, after the background updater took its changes."""
+        self.saved = json.dumps(feeds,indent=4)
+
+    def save(self,feeds,max_delay=0):
+        """Writes the feed list to disk if it changed since the last write.
+
+        Args:
+            feeds (dictionary): The feeds to save.
+            max_delay (int, optional): If the file was written less than this many seconds ago, the
+            write is postponed until the next call to flush. Defaults to 0.
+
+        Returns:
+            bool: True if the file was written.
+        """
+        if max_delay > 0 and time.monotonic() - self.last_write < max_delay:
+            self.pending = True
+            return False
+        s = json.dumps(feeds,indent=4)
+        self.pending = False
+        if s == self.saved:
+            if self.verbose:print("No changes to save.")
+            return False
+        if self.verbose:print("Trying to save file...")
+        folder = os.path.dirname(os.path.abspath(self.path))
+        fd,tmp = tempfile.mkstemp(prefix='.feedinfo.',suffix='.tmp',dir=folder)
+        try:
+            with os.fdopen(fd,'w') as f:
+                f.write(s)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp,self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.saved = s
+        self.last_write = time.monotonic()
+        if self.verbose:print("Saved.")
+        return True
+
+    def flush(self,feeds,max_delay):
+        """Writes changes postponed by save once max_delay seconds have passed since the last write.
+
+        Args:
+            feeds (dictionary): The feeds to save.
+            max_delay (int): Minimum number of seconds between writes.
+        """
+        if self.pending:
+            self.save(feeds,max_delay)
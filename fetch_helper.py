@@ -0,0 +1,226 @@
+import hashlib
+import threading
+import time
+import zlib
+from urllib.parse import urljoin, urlparse
+
+USER_AGENT = "TermRSS (+https://github.com/JustADataConstruct/TermRSS)"
+ACCEPT = "application/atom+xml,application/rdf+xml,application/rss+xml,application/xml;q=0.9,text/xml;q=0.2,*/*;q=0.1"
+MAX_REDIRECTS = 5
+
+
+class FetchError(Exception):
+    """Raised when a feed can't be downloaded: the connection failed, timed out, or the response was too big."""
+
+
+class FetchHelper():
+    def __init__(self,config):
+        """Downloads feeds over keep-alive connections that are kept open and reused by every feed on the
+        same host, so a cycle only pays for one handshake per host. Responses are requested compressed,
+        conditional requests are sent with the saved etag and last-modified values, and every request is
+        limited by fetch_connect_timeout, fetch_read_timeout and fetch_max_bytes. A whole download,
+        redirects included, is abandoned once it takes longer than fetch_deadline_seconds, so a server
+        that sends its feed a few bytes at a time can't hold a worker forever.
+
+        Args:
+            config (object): A json object parsing the config.json file.
+        """
+        self.config = config
+        self.verbose = config["verbose_mode"]
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.ssl_context = None
+
+    def get(self,url,etag="",modified=""):
+        """Downloads a url, following redirects. Safe to call from several threads at once.
+
+        Args:
+            url (string): The url to download.
+            etag (string, optional): Etag saved from the last download. Defaults to "".
+            modified (string, optional): Last-Modified value saved from the last download. Defaults to "".
+
+        Returns:
+            dictionary: status (301 or 302 if the url was redirected, like feedparser does), href (the
+            final url), headers (with lowercase names), body (the uncompressed bytes), digest (a hash of
+            the body), bytes (the bytes received) and bytes_saved (the bytes compression saved).
+
+        Raises:
+            FetchError: If the server couldn't be reached, took too long or sent too much.
+        """
+        headers = {"User-Agent":USER_AGENT,"Accept":ACCEPT,"Accept-Encoding":"gzip, deflate"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        redirect = None
+        deadline = self.config["fetch_deadline_seconds"]
+        deadline = time.monotonic() + deadline if deadline > 0 else None
+        for _ in range(MAX_REDIRECTS + 1):
+            status,response_headers,raw = self.request(url,headers,deadline)
+            if status in (301,302,303,307,308) and "location" in response_headers:
+                if redirect != 301: #A permanent redirect anywhere on the way wins, so the saved url is updated.
+                    redirect = 301 if status in (301,308) else 302
+                url = urljoin(url,response_headers["location"])
+                if self.verbose:print(f"Redirected to {url}")
+                continue
+            body = self.decode(raw,response_headers.get("content-encoding",""))
+            return {
+                "status":redirect if redirect != None and status == 200 else status,
+                "href":url,
+                "headers":response_headers,
+                "body":body,
+                "digest":hashlib.blake2b(body,digest_size=16).hexdigest(),
+                "bytes":len(raw),
+                "bytes_saved":max(0,len(body) - len(raw))
+            }
+        raise FetchError(f"Too many redirects from {url}")
+
+    def request(self,url,headers,deadline=None):
+        """Sends a single GET request on a pooled connection. A connection that was closed by the server
+        while idle is replaced and the request retried once.
+
+        Args:
+            url (string): The url to download.
+            headers (dictionary): The request headers.
+            deadline (float, optional): time.monotonic() value after which the request is abandoned.
+            Defaults to None, no deadline.
+
+        Returns:
+            tuple: The status, the response headers and the raw body.
+        """
+        import http.client
+        parts = urlparse(url)
+        if parts.scheme not in ("http","https"):
+            raise FetchError(f"Unsupported url scheme: {parts.scheme}")
+        key = (parts.scheme,parts.netloc.lower())
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        for attempt in range(2):
+            conn,reused = self.acquire(key,deadline)
+            try:
+                self.set_timeout(conn,self.config["fetch_read_timeout"],deadline)
+                conn.request("GET",path,headers=headers)
+                response = conn.getresponse()
+                raw = self.read(conn,response,deadline)
+            except (http.client.RemoteDisconnected,ConnectionResetError,BrokenPipeError) as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue #The server closed it while it was idle.
+                raise FetchError(f"Connection to {parts.netloc} failed: {e}")
+            except (OSError,http.client.HTTPException) as e:
+                conn.close()
+                raise FetchError(f"Connection to {parts.netloc} failed: {e}")
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self.release(key,conn)
+            return response.status,{k.lower():v for k,v in response.getheaders()},raw
+        raise FetchError(f"Connection to {parts.netloc} failed")
+
+    def acquire(self,key,deadline=None):
+        """Returns an idle connection to the host, or a new one.
+
+        Returns:
+            tuple: The connection, and True if it was used before.
+        """
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop(),True
+        import http.client
+        scheme,netloc = key
+        timeout = self.remaining(self.config["fetch_connect_timeout"],deadline,netloc)
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(netloc,timeout=timeout,context=self.context())
+        else:
+            conn = http.client.HTTPConnection(netloc,timeout=timeout)
+        if self.verbose:print(f"Opening connection to {netloc}")
+        try:
+            conn.connect()
+        except OSError as e:
+            conn.close()
+            raise FetchError(f"Couldn't connect to {netloc}: {e}")
+        return conn,False
+
+    def remaining(self,timeout,deadline,host):
+        """Returns the timeout to use for the next socket operation: the configured one, or less if the
+        deadline is closer.
+
+        Raises:
+            FetchError: If the deadline already passed.
+        """
+        if deadline == None:
+            return timeout
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise FetchError(f"{host} took longer than {self.config['fetch_deadline_seconds']} seconds")
+        return min(timeout,left) if timeout else left
+
+    def set_timeout(self,conn,timeout,deadline):
+        """Sets the timeout of a connection's socket, keeping it within the deadline."""
+        if conn.sock != None:
+            conn.sock.settimeout(self.remaining(timeout,deadline,conn.host))
+
+    def release(self,key,conn):
+        """Keeps a connection open to be reused by the next request to the same host."""
+        with self.lock:
+            self.idle.setdefault(key,[]).append(conn)
+
+    def context(self):
+        """The SSL context shared by every https connection."""
+        if self.ssl_context == None:
+            import ssl
+            self.ssl_context = ssl.create_default_context()
+        return self.ssl_context
+
+    def read(self,conn,response,deadline=None):
+        """Reads a response body, failing as soon as it's bigger than fetch_max_bytes or the deadline
+        passes. Reads return whatever already arrived, so the deadline is checked even if the server
+        sends a few bytes at a time."""
+        limit = self.config["fetch_max_bytes"]
+        length = response.getheader("content-length")
+        if limit > 0 and length != None and length.isdigit() and int(length) > limit:
+            raise FetchError(f"Response too big ({length} bytes)")
+        chunks = []
+        size = 0
+        while True:
+            self.set_timeout(conn,self.config["fetch_read_timeout"],deadline)
+            chunk = response.read1(65536)
+            if not chunk:
+                response.close() #An empty body isn't marked as finished by read1, and the connection can't be reused until it is.
+                break
+            size += len(chunk)
+            if limit > 0 and size > limit:
+                raise FetchError(f"Response bigger than {limit} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def decode(self,raw,encoding):
+        """Uncompresses a gzip or deflate body, keeping it under fetch_max_bytes."""
+        encoding = encoding.strip().lower()
+        if encoding not in ("gzip","x-gzip","deflate") or len(raw) == 0:
+            return raw
+        limit = self.config["fetch_max_bytes"]
+        #gzip headers are detected automatically; deflate may come with or without its zlib header.
+        for wbits in ((47,) if encoding != "deflate" else (15,-15)):
+            try:
+                d = zlib.decompressobj(wbits)
+                body = d.decompress(raw,limit + 1 if limit > 0 else 0)
+            except zlib.error:
+                continue
+            if limit > 0 and len(body) > limit:
+                raise FetchError(f"Response bigger than {limit} bytes once uncompressed")
+            return body
+        raise FetchError(f"Couldn't uncompress the {encoding} response")
+
+    def close(self):
+        """Closes every idle connection."""
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = {}
@@ -0,0 +1,107 @@
+import subprocess as sp
+import time
+
+
+class NotifyHelper():
+    def __init__(self,config):
+        """Collects the results of the feeds checked by the background updater and shows them in a
+        single desktop notification. Counts that didn't change since they were last shown are skipped,
+        the same error is only repeated after notify_repeat_minutes, and notifications are never sent
+        more often than every notify_min_seconds. Uses D-Bus directly when dbus-python is installed,
+        and notify-send otherwise.
+
+        Args:
+            config (object): A json object parsing the config.json file.
+        """
+        self.config = config
+        self.verbose = config["verbose_mode"]
+        self.pending = {}
+        self.shown = {}
+        self.last_sent = 0
+        self.notification_id = 0
+        self.process = None
+        self.dbus = None
+
+    def count(self,name,count,message):
+        """Adds the unread count of a feed to the next notification. Skipped if it's 0 or it's the same
+        count that was last shown for that feed.
+
+        Args:
+            name (string): Name of the feed.
+            count (int): Number of unread entries.
+            message (string): Text to show for this feed.
+        """
+        if count == 0:
+            self.pending.pop(name,None)
+            self.shown.pop(name,None) #So the same count is shown again when new entries arrive.
+            return
+        if self.shown.get(name,(None,0))[0] == count:
+            self.pending.pop(name,None)
+            return
+        self.pending[name] = (count,message,False)
+
+    def error(self,name,message):
+        """Adds an error of a feed to the next notification. Skipped if the same error was shown less
+        than notify_repeat_minutes ago.
+
+        Args:
+            name (string): Name of the feed.
+            message (string): Text of the error.
+        """
+        value,when = self.shown.get(name,(None,0))
+        if value == message and time.monotonic() - when < self.config["notify_repeat_minutes"] * 60:
+            return
+        self.pending[name] = (message,message,True)
+
+    def flush(self):
+        """Sends the collected results as one notification, unless the last one was sent less than
+        notify_min_seconds ago. In that case they're kept and merged with the next results.
+        """
+        if len(self.pending) == 0:
+            return
+        now = time.monotonic()
+        if now - self.last_sent < self.config["notify_min_seconds"]:
+            return
+        names = sorted(self.pending)
+        if len(names) == 1:
+            title = names[0]
+            body = self.pending[names[0]][1]
+        else:
+            errors = len([n for n in names if self.pending[n][2]])
+            title = f"TermRSS: {len(names) - errors} feed(s) updated" if errors == 0 else f"TermRSS: {len(names) - errors} feed(s) updated, {errors} error(s)"
+            body = "\n".join(f"{n}: {self.pending[n][1]}" for n in names)
+        self.send(title,body)
+        for n in names:
+            self.shown[n] = (self.pending[n][0],now)
+        self.pending = {}
+        self.last_sent = now
+
+    def load_dbus(self):
+        """Imports dbus-python the first time a notification is sent. Returns None if it's not installed."""
+        if self.dbus == None:
+            try:
+                import dbus
+                self.dbus = dbus
+            except ImportError:
+                self.dbus = False
+        return self.dbus if self.dbus != False else None
+
+    def send(self,title,body):
+        """Shows a notification, replacing the previous one when the D-Bus backend is available."""
+        if self.verbose:print(f"Notification: {title} - {body}")
+        dbus = self.load_dbus()
+        if dbus != None:
+            try:
+                bus = dbus.SessionBus()
+                proxy = bus.get_object('org.freedesktop.Notifications','/org/freedesktop/Notifications')
+                notifications = dbus.Interface(proxy,'org.freedesktop.Notifications')
+                self.notification_id = notifications.Notify("TermRSS",self.notification_id,"",title,body,[],{},-1)
+                return
+            except dbus.DBusException as e:
+                if self.verbose:print(f"D-Bus notification failed, using notify-send: {e}")
+        if self.process != None:
+            self.process.poll() #Collects the previous notify-send once it exits.
+        try:
+            self.process = sp.Popen(['notify-send',title,body])
+        except FileNotFoundError:
+            if self.verbose:print("notify-send not found.")
@@ -7,13 +7,13 @@ class OutputHelper():
             colorama.init(autoreset=True)
 
     def format_entry(self,name,entry,desc,new):
-        s = self.write_feed_entry(entry["title"],new)
-
-        s = s + self.write_feed_link(entry["link"])
-        s = s + self.write_feed_description(desc,new)
-        s = s + self.write_feed_description(entry["published"]) + "\n\n"
-        
-        return s
+        return "".join((
+            self.write_feed_entry(entry["title"],new),
+            self.write_feed_link(entry["link"]),
+            self.write_feed_description(desc,new),
+            self.write_feed_description(entry["published"]),
+            "\n\n"
+        ))
 
     def write_feed_header(self,msg):
         if self.color:
@@ -0,0 +1,1068 @@
+import json
+import argparse
+import itertools
+from datetime import datetime, timezone
+import subprocess as sp
+import time
+import os
+import signal
+import sys
+import contextlib
+
+from output_helper import OutputHelper
+from cache_helper import CacheHelper, UNKNOWN, UNREAD
+from feed_helper import FeedHelper
+from update_helper import UpdateHelper
+from daemon_helper import DaemonHelper, UpdaterBusy
+from scheduler_helper import SchedulerHelper
+from notify_helper import NotifyHelper
+from fetch_helper import FetchHelper
+from stats_helper import StatsHelper
+from category_helper import CategoryHelper, normalize_categories
+from entry_helper import entry_digest, entry_id, entry_timestamp, html_to_text
+
+#The script that runs TermRSS, used to start the background updater.
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),"termrss.py")
+
+DEFAULT_CONFIG = {
+    "update_time_minutes": 10,
+    "enable_color_output": True,
+    "verbose_mode": False,
+    "max_concurrent_fetches": 8,
+    "max_fetches_per_host": 2,
+    "feedinfo_flush_seconds": 0,
+    "min_poll_minutes": 5,
+    "max_poll_minutes": 1440,
+    "poll_jitter": 0.1,
+    "notify_min_seconds": 60,
+    "notify_repeat_minutes": 360,
+    "compress_cache": False,
+    "stats_cycles": 50,
+    "stats_export_path": "",
+    "archive_max_entries": 1000,
+    "archive_max_bytes": 0,
+    "archive_max_days": 0,
+    "archive_compact_hours": 24,
+    "fetch_backend": "pooled",
+    "fetch_connect_timeout": 10,
+    "fetch_read_timeout": 30,
+    "fetch_max_bytes": 10485760,
+    "fetch_deadline_seconds": 60,
+    "circuit_breaker_failures": 5,
+    "circuit_breaker_cooldown_minutes": 1440,
+    "parse_workers": 0,
+    "incremental_parse": False
+}
+
+def non_negative(value):
+    """Argparse type for counts like --limit and --offset.
+
+    Args:
+        value (string): The value given on the command line.
+
+    Returns:
+        int: The value as an integer.
+
+    Raises:
+        argparse.ArgumentTypeError: If it's not an integer or it's negative.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, not {number}")
+    return number
+
+
+class TermRSS():   
+    def __init__(self):
+        """Parses the command line and runs the command. Only the parts each command needs are loaded:
+        feedinfo.json is read the first time self.feeds is used, and feedparser, listparser and
+        BeautifulSoup are imported by the functions that use them, so commands like show, clear or
+        stop start quickly.
+        """
+        self._feeds = None
+        self.config = {}
+        self.parser = argparse.ArgumentParser(add_help=False,usage="Run termrss.py help to read the manual.")
+        self.parser.add_argument("command",choices=['help','update','read','add','remove','show','start','stop','import','clear','migrate','status','stats','search','compact','export'])
+        self.parser.add_argument("-n","--name")
+        self.parser.add_argument("-u","--url")
+        self.parser.add_argument("-r","--refresh",action='store_true')
+        self.parser.add_argument("--bg",action="store_true")
+        self.parser.add_argument("-c","--categories")
+        self.parser.add_argument("-f","--force-add",action="store_true")
+        self.parser.add_argument("-a","--all",action="store_true")   
+        self.parser.add_argument("-y","--yes",action="store_true")
+        self.parser.add_argument("--bozo",choices=['ask','accept','skip'],default='ask')
+        self.parser.add_argument("--format",choices=['text','json','prometheus'],default='text')
+        self.parser.add_argument("-q","--query")
+        self.parser.add_argument("--limit",type=non_negative)
+        self.parser.add_argument("--offset",type=non_negative,default=0)
+        self.parser.add_argument("--since")
+        self.parser.add_argument("--order",choices=['feed','newest'],default='feed')
+        self.parser.add_argument("--unread",action="store_true")
+        args = self.parser.parse_args()
+
+        try:
+            with open('config.json') as f:
+                s = f.read()
+                self.config = json.loads(s)
+        except IOError:
+            print("config file not found. Going back to defaults.")
+            self.config = dict(DEFAULT_CONFIG)
+            f = open('config.json','w')
+            f.write(json.dumps(self.config,indent=4))
+            f.close()
+        for key,value in DEFAULT_CONFIG.items(): #Older config files may be missing newer settings.
+            self.config.setdefault(key,value)
+
+        self.output = OutputHelper(self.config["enable_color_output"])
+        self.scheduler = SchedulerHelper(self.config)
+        self.notify = NotifyHelper(self.config)
+        self.fetcher = FetchHelper(self.config)
+        self.cache = CacheHelper(self.output,self.config,self.scheduler,self.notify,self.fetcher)
+        self.updater = UpdateHelper(self.cache,self.config)
+        self.feedinfo = FeedHelper(self.output,self.config)
+        self.daemon = DaemonHelper(self.output,self.config)
+        self.stats = StatsHelper(self.config)
+        self.categories = CategoryHelper(self.config)
+        self.verbose = self.config["verbose_mode"]
+        self.is_daemon = False
+        self.parse_args(args)
+
+    @property
+    def feeds(self):
+        """The feeds saved on feedinfo.json. Loaded the first time they're needed."""
+        if self._feeds == None:
+            try:
+                self.feeds = self.feedinfo.load()
+            except IOError as e:
+                self.output.write_error("Feedinfo not found! Recreating it now.")
+                self._feeds = {}
+                self.add_feed("Sample feed","https://www.feedforall.com/sample.xml",["test"])
+        return self._feeds
+
+    @feeds.setter
+    def feeds(self,value):
+        """Replaces the feed list, normalizing its categories and rebuilding the category index."""
+        self._feeds = value
+        self.categories.build(value)
+
+    def parse_args(self,args):
+        if args.bg:
+            self.run_background_updater()
+            return
+
+        categories = args.categories if args.categories != None else "" #A category query, see category_helper.parse_query.
+        try:
+            since = self.parse_since(args.since) if args.since != None else None
+        except ValueError as e:
+            self.output.write_error(str(e))
+            return
+
+        if args.command != None:
+            if args.command.lower() == "add":
+                if args.name == None or args.url == None:
+                    self.parser.print_help()
+                else:
+                    self.add_feed(args.name,args.url,normalize_categories(categories),args.force_add)
+            elif args.command.lower() == "remove":
+                if args.name == None:
+                    self.parser.print_help()
+                else:
+                    self.remove_feed(args.name)
+                    self.output.write_ok("Feed removed!")
+            elif args.command.lower() == "show":
+                self.show_feeds(categories)
+            elif args.command.lower() == "update":
+                self.check_new_entries(True,categories,args.refresh)
+            elif args.command.lower() == "read":
+                self.read_updates(args.name,args.all,categories,since,args.limit,args.offset,args.order)
+            elif args.command.lower() == "clear":
+                try:
+                    self.mark_as_read(args.name,categories)
+                    self.output.write_ok("Feeds cleared!")
+                except UpdaterBusy as e:
+                    self.output.write_error(str(e))
+            elif args.command.lower() == "start":
+                try:
+                    running = self.is_updater_running()
+                    if running:
+                        self.daemon.send("update")
+                        self.output.write_info("Background updater already running! Asked it to check for new entries now.")
+                except UpdaterBusy as e:
+                    running = True
+                    self.output.write_error(str(e))
+                if running == False:
+                    try:
+                        self.start_background_updater()
+                    except Exception as e:
+                        self.output.write_error(f"Something went wrong when trying to run the updater: {e}")
+            elif args.command.lower() == "stop":
+                try:
+                    self.stop_background_updater()
+                except UpdaterBusy as e:
+                    self.output.write_error(str(e))
+                except IOError as e:
+                    self.output.write_info("Background updater is not running.")
+            elif args.command.lower() == "status":
+                self.show_updater_status()
+            elif args.command.lower() == "stats":
+                self.show_stats(args.format)
+            elif args.command.lower() == "search":
+                if args.query == None:
+                    print("Usage: termrss.py search -q WORDS [-n NAME] [-c CATEGORIES] [--limit N]")
+                else:
+                    self.search_entries(args.query,args.name,categories,args.limit if args.limit != None else 20)
+            elif args.command.lower() == "export":
+                self.export_entries(args.name,categories,args.unread,since,args.limit,args.offset,args.order)
+            elif args.command.lower() == "import":
+                if args.url == None:
+                    print("Usage: termrss.py import -u [OPML URL OR LOCAL PATH]")
+                else:
+                    self.import_feeds(args.url,args.yes,args.bozo,args.force_add)
+            elif args.command.lower() == "migrate":
+                path = args.url if args.url != None else "rsscache.json"
+                try:
+                    count = self.cache.migrate_json_cache(path)
+                    self.output.write_ok(f"Migrated {count} feed(s) from {path} to {self.cache.path}.")
+                except (IOError,ValueError) as e:
+                    self.output.write_error(f"Couldn't migrate {path}: {e}")
+            elif args.command.lower() == "compact":
+                self.compact_cache()
+            elif args.command.lower() == "help":
+                sp.call(['less','-R',"README.md"])        
+            else:
+                self.parser.print_help()
+        else:
+            self.parser.print_help()
+
+    def save_feed_file(self,max_delay=0):
+        """Saves changes made to the self.feeds dictionary to the feedinfo.json file. Nothing is written
+        if there are no changes.
+
+        Args:
+            max_delay (int, optional): If the file was written less than this many seconds ago, the
+            write is postponed until the background updater flushes it. Defaults to 0.
+        """
+        if self.is_daemon == False and self.send_changes():
+            return
+        self.feedinfo.save(self.feeds,max_delay)
+
+    def send_changes(self):
+        """If the background updater is running, sends it the changes made to the feed list, so it
+        applies them to its own list and saves it. Otherwise its next save would overwrite them.
+
+        Returns:
+            bool: True if the updater took the changes.
+        """
+        if self._feeds == None:
+            return False
+        changes = self.feedinfo.changes(self._feeds)
+        if changes == None:
+            return False
+        try:
+            answer = self.daemon.send("merge",**changes)
+        except UpdaterBusy as e:
+            self.output.write_error(f"{e} The change was saved, but restart the updater (stop and start) so it doesn't overwrite it.")
+            return False
+        if answer == None:
+            return False
+        if answer.get("ok") == False:
+            self.output.write_error(f"The background updater couldn't take the changes: {answer.get('error')}")
+            return False
+        if self.verbose:print("Changes sent to the background updater.")
+        self.feedinfo.synced(self._feeds)
+        return True
+
+    def merge_changes(self,changes):
+        """Applies the changes sent by another command (see FeedHelper.changes) to the feed list. Feeds
+        are changed in place, so an update cycle that is running keeps working on the same objects.
+
+        Args:
+            changes (dictionary): The changed values, the removed keys and the removed feeds.
+        """
+        for name in changes.get("removed",[]):
+            if name in self.feeds:
+                self.remove_categories(name)
+                self.feeds.pop(name)
+        for name,values in changes.get("feeds",{}).items():
+            self.remove_categories(name)
+            feed = self.feeds.setdefault(name,{})
+            feed.update(values)
+            for key in changes.get("unset",{}).get(name,[]):
+                feed.pop(key,None)
+            self.categories.add(name,feed["categories"])
+        if self.in_cycle == False:
+            self.scheduler.build(self.feeds)
+
+    def add_feed(self,feedname,feedURL,categories=[],force=False):
+        """Adds a new feed to the self.feeds dictionary and saves it to file. Handles errors and
+        telling the background updater.
+
+        Args:
+            feedname (string): Name to identify the feed.
+            feedURL (string): The URL of the feed.
+            categories (list of strings, optional): Categories of the feed. Defaults to [].
+            force (bool, optional): If True, will add the feed even if entries can't be detected. Defaults to False.
+        """
+        feedURL = self.normalize_url(feedURL)
+        try:
+            if self.verbose:print("Trying to parse feed...")
+            f = self.cache.fetch_feed(feedURL,"","",True)
+        except Exception as e:
+            self.output.write_error(f"Something went wrong when trying to parse this feed ({feedname}): {e}")
+            return
+        finally:
+            self.cache.close_parse_pool()
+        if len(f["entries"]) == 0 and force == False :
+            self.output.write_error(f"No entries detected on feed {feedname}. Please make sure this URL is a valid feed. If you are sure the URL is correct, repeat the add command with the '-f' flag to forceadd it.")
+            return
+        if f["bozo"]:
+            self.output.write_error(f"A problem was detected with your feed:{f['bozo_exception']}. You may find problems when reading its entries. Do you want to add it? [Y]es/[N]o")
+            answer = input()
+            if answer.lower() == "n" or answer.lower() == "no":
+                return
+        self.remove_categories(feedname.upper())
+        self.feeds[feedname.upper()] = self.new_feed(feedURL,categories,f)
+        self.categories.add(feedname.upper(),self.feeds[feedname.upper()]["categories"])
+        self.save_feed_file()
+        self.cache.save_cache_file(feedname,f)
+        self.output.write_ok(f"Feed {feedname} added!") 
+
+    def normalize_url(self,feedURL):
+        """Adds the http:// prefix to urls that don't have one."""
+        if feedURL.startswith(('http://','https://')) == False:
+            if self.verbose:print("Checking if url has prefix...")        
+            feedURL = "http://" + feedURL
+        return feedURL
+
+    def new_feed(self,feedURL,categories,result):
+        """Returns the feed object saved on feedinfo.json for a feed that was just fetched.
+
+        Args:
+            feedURL (string): The URL of the feed.
+            categories (list of strings): Categories of the feed.
+            result (dictionary): The compact result returned by CacheHelper.fetch_feed.
+
+        Returns:
+            dictionary: The feed object.
+        """
+        initdate = str(datetime(1960,1,1,0,0,0))
+        return {
+            'url':feedURL,
+            'last_check':initdate,
+            'last_read':initdate,
+            'categories':normalize_categories(categories),
+            'etag':result["etag"],
+            'last-modified':result["modified"],
+            'digest':result.get("digest",""),
+            'unread':len(result["entries"]),
+            'valid':True
+        }
+
+    def remove_feed(self,feedname):
+        """Removes a feed from the self.feeds dictionary, removes that feed from the cache file, and
+        saves the changes to disl.
+
+        Args:
+            feedname (string): Name of the feed to remove.
+        """
+        if self.feeds[feedname.upper()] !=None:
+            if self.verbose:print("Feed exists, removing.")
+            self.remove_categories(feedname.upper())
+            self.feeds.pop(feedname.upper())
+            self.save_feed_file()
+            self.cache.remove_from_cache(feedname)
+
+    def remove_categories(self,name):
+        """Removes a feed from the category index, if it's on the feed list."""
+        if name in self.feeds:
+            self.categories.remove(name,self.feeds[name]["categories"])
+
+    def check_new_entries(self,to_console=True,categories="",force_refresh=False,names=None,ignore_schedule=False):
+        """Tries to fetch new entries from the server. The feeds that are due are fetched concurrently by
+        UpdateHelper, and their results are applied with CacheHelper.apply_result in list order.
+
+        Args:
+            to_console (bool, optional): If true, will self.output to terminal. False when using the
+            background process.. Defaults to True.
+            categories (string, optional): Category query (see category_helper.parse_query). Defaults to "".
+            force_refresh (bool, optional): If true, every feed is downloaded and parsed from the
+            server even if there are no changes. Defaults to False.
+            names (list of strings, optional): If present, only these feeds are checked. Used by the
+            background updater to check the feeds that are due. Defaults to None.
+            ignore_schedule (bool, optional): If True, every feed is fetched even if its next check
+            hasn't arrived yet. Defaults to False.
+        """
+        if to_console:
+            self.output.write_info("Checking for new entries...")
+        if names != None:
+            lst = [x for x in names if x in self.feeds]
+        elif len(categories) > 0:
+            lst = self.categories.select(self.feeds,categories)
+            if self.verbose:print("Filtering categories...")
+        else:
+            lst = self.feeds
+            if self.verbose:print("Using main feed list.")
+        due = []
+        for n in lst:
+            if self.feeds[n]["valid"] == False:
+                continue
+            if ignore_schedule or self.cache.is_due(self.feeds[n],force_refresh):
+                due.append(n)
+        if len(due) > 0:
+            self.stats.start_cycle("update")
+        self.cache.open_parse_pool()
+        fetches = self.updater.fetch_all(self.feeds,due,force_refresh)
+        #Results are applied in list order so the output doesn't depend on which server answered first.
+        for n in lst:
+            if n not in self.feeds:
+                continue #Removed by another command while the background updater was fetching.
+            if self.feeds[n]["valid"] == False:
+                if to_console:
+                    self.output.write_error(f"{n} is no longer valid and will not be updated. Please remove it from your list.")
+                else:
+                    self.notify.error(n,"Invalid feed.")
+                continue
+            if n in fetches:
+                try:
+                    result = self.updater.wait(fetches[n],self.daemon.poll)
+                    if n not in self.feeds:
+                        continue
+                except Exception as e:
+                    if to_console:
+                        self.output.write_error(f"Something went wrong when trying to fetch {n}: {e}")
+                    else:
+                        self.notify.error(n,f"[ERROR] Couldn't fetch the feed: {e}")
+                    self.scheduler.plan(self.feeds[n],None,str(e))
+                    self.stats.record(n,status="error")
+                    self.feeds[n]["last_check"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    continue
+                start = time.perf_counter()
+                self.cache.apply_result(n,self.feeds[n],result,to_console)
+                self.stats.record(n,status=result["status"] if result["status"] != None else "error",bytes=result.get("bytes"),bytes_saved=result.get("bytes_saved"),
+                                  fetch_s=result.get("fetch_s"),parse_s=result.get("parse_s"),save_s=time.perf_counter() - start,
+                                  unchanged=result.get("unchanged"),partial=result.get("partial"))
+                self.feeds[n]["last_check"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                self.cache.report_cached(n,self.feeds[n],to_console)
+        self.cache.close_parse_pool()
+        self.save_feed_file(0 if to_console else self.config["feedinfo_flush_seconds"])
+        self.stats.end_cycle()
+
+    def read_updates(self,name,all = False,categories="",since=None,limit=None,offset=0,order="feed"): 
+        """Grabs entries from cache and self.outputs them via the less command. Entries are rendered
+        one at a time and piped to less as they're ready, so the first page shows up right away and
+        nothing is kept in memory after it's written. With since, limit or offset only the entries that
+        will be shown are read from the cache.
+
+        Args:
+            name (string): Name of the feed that wants to be read. If none, grabs all updated unless
+            categories is not empty.
+            all (bool, optional): If True, shows all self.feeds (categorized or existing). Defaults to False.
+            categories (string, optional): Category query (see category_helper.parse_query). Defaults to "".
+            since (float, optional): Only entries published at or after this unix timestamp are shown.
+            Defaults to None.
+            limit (int, optional): Maximum number of entries of each feed, or in total if order is
+            "newest". Defaults to None, no limit.
+            offset (int, optional): Number of entries to skip first, counted like limit. Defaults to 0.
+            order (string, optional): "feed" or "newest" (see render_updates). Defaults to "feed".
+        """
+        if name != None and self.feeds[name.upper()] != None:
+            lst = [name.upper()]
+        else:
+            if len(categories) > 0:
+                lst = self.categories.select(self.feeds,categories)
+                if self.verbose:print("Filtering categories...")
+            else:
+                lst = list(self.feeds)
+                if self.verbose:print("Using main feed list...")
+            if all == False:
+                lst = [x for x in lst if self.feeds[x]["unread"] > 0]
+        for n in lst:
+            if self.verbose:print("Trying to load from self.cache...")
+            if self.cache.load_from_cache(n,False) == None: return
+        if self.verbose:print("Calling less")
+        self.stats.start_cycle("read")
+        pager = sp.Popen(['less','-R'],stdin=sp.PIPE,encoding='utf-8')
+        chunks = self.render_updates(lst,since,limit,offset,order)
+        try:
+            for chunk in chunks:
+                pager.stdin.write(chunk)
+                pager.stdin.flush()
+            pager.stdin.write("\n['Q' to exit]")
+            pager.stdin.close()
+        except BrokenPipeError: #The user closed less before reaching the end.
+            pass
+        chunks.close() #Marks the entries that were shown as read.
+        pager.wait()
+        self.save_feed_file()
+        self.stats.end_cycle()
+
+    def render_updates(self,lst,since=None,limit=None,offset=0,order="feed"):
+        """Yields the formatted text of every entry of the indicated feeds, one piece at a time. Each
+        feed is marked as read just before it's rendered, and once the generator is closed the feeds that
+        weren't reached are marked too, so it doesn't matter how far the user scrolls. If the read is
+        bounded by since, limit or offset, or ordered by date, only the entries that are rendered are
+        loaded and marked as read, once the generator is closed. Read states are loaded one feed at a
+        time, when the feed is reached.
+
+        Args:
+            lst (list of strings): Names of the feeds to render.
+            since (float, optional): Only entries published at or after this unix timestamp are
+            rendered. Defaults to None.
+            limit (int, optional): Maximum number of entries of each feed, or in total if order is
+            "newest". Defaults to None, no limit.
+            offset (int, optional): Number of entries to skip first, counted like limit. Defaults to 0.
+            order (string, optional): "feed" renders the feeds one after another; "newest" merges the
+            entries of every feed, newest first. Defaults to "feed".
+
+        Yields:
+            string: A feed header or a formatted entry.
+        """
+        if len(lst) == 0:
+            yield "No new entries on any feed. Run read -a to see all past entries."
+            return
+        def lastread(n):
+            return datetime.strptime(self.feeds[n]["last_read"],'%Y-%m-%d %H:%M:%S')
+        if since == None and limit == None and offset == 0 and order == "feed":
+            def clear(names):
+                for n in names:
+                    self.feeds[n]["last_read"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    self.feeds[n]["unread"] = 0
+                self.cache.mark_read(names)
+            rendered = 0
+            try:
+                for n in lst:
+                    read,unread = lastread(n),self.cache.unread_states(n)
+                    clear([n])
+                    rendered += 1
+                    yield from self.grab_entries(n,read,unread)
+            finally:
+                clear(lst[rendered:])
+            return
+
+        def feed_order():
+            for n in lst:
+                for e in self.cache.iter_entries(n,since,limit,offset):
+                    yield n,e
+        if order == "newest":
+            rows = itertools.islice(self.cache.iter_newest(lst,since),offset,offset + limit if limit != None else None)
+        else:
+            rows = feed_order()
+        shown = {n:[] for n in lst}
+        states = {}
+        try:
+            for n,group in itertools.groupby(rows,key=lambda row:row[0]): #A header every time the feed changes.
+                if n not in states:
+                    states[n] = (lastread(n),self.cache.unread_states(n))
+                yield from self.grab_entries(n,states[n][0],states[n][1],(e for _,e in group),shown[n])
+            if sum(len(x) for x in shown.values()) == 0:
+                yield "No entries match."
+        finally:
+            self.cache.mark_entries_read({n:[d for d,_ in x] for n,x in shown.items()})
+            for n,x in shown.items():
+                self.feeds[n]["unread"] = max(0,self.feeds[n]["unread"] - sum(1 for _,new in x if new))
+
+    def grab_entries(self,name,lastread,unread={},entries=None,shown=None):
+        """Yields the feed's entries in a nice format, loading them from cache one at a time.
+
+        Args:
+            name (string): Name of the feed.
+            lastread (datetime): When the feed was last read. Entries cached before read states were
+            saved are marked as new if they were published after this date.
+            unread (dictionary, optional): Read state of the unread entries, by digest (see
+            CacheHelper.unread_states). These entries are marked as new. Defaults to {}.
+            entries (iterable, optional): The entries to render. Defaults to None, every cached entry.
+            shown (list, optional): If present, the digest of every rendered entry is appended to it,
+            along with True if it was new. Defaults to None.
+
+        Yields:
+            string: The feed header, and then each entry.
+        """
+        url = self.feeds[name.upper()]["url"]
+        yield self.output.write_feed_header(f"----[{name.upper()} - {url}]----") + "\n"
+
+        if self.verbose:print("Grabbing entries...")
+        for e in (entries if entries != None else self.cache.iter_entries(name)):
+            start = time.perf_counter()
+            digest = entry_digest(entry_id(e))
+            new = self.is_unread(e,unread.get(digest),lastread)
+            desc = e["summary_text"] if "summary_text" in e else html_to_text(e["summary"]) #Entries cached by older versions.
+            text = self.output.format_entry(name,e,desc,new)
+            self.stats.record(name,render_s=time.perf_counter() - start) #Time spent waiting on less isn't counted.
+            if shown != None:
+                shown.append((digest,new))
+            yield text
+
+    def is_unread(self,entry,state,lastread):
+        """Returns True if an entry hasn't been read.
+
+        Args:
+            entry (dictionary): The entry.
+            state (int): Its read state (see CacheHelper.unread_states), None if it was read.
+            lastread (datetime): When its feed was last read. Entries cached before read states were
+            saved are unread if they were published after this date.
+        """
+        if state == UNKNOWN:
+            return entry["published_parsed"] != None and datetime.fromtimestamp(time.mktime(time.struct_time(entry["published_parsed"]))) > lastread
+        return state == UNREAD
+
+    def parse_since(self,value):
+        """Parses the --since argument: a date (YYYY-MM-DD, optionally followed by HH:MM or HH:MM:SS) or
+        a number of minutes, hours, days or weeks ago (30m, 12h, 2d, 1w).
+
+        Args:
+            value (string): The argument.
+
+        Returns:
+            float: The unix timestamp it refers to.
+
+        Raises:
+            ValueError: If it's not in any of those formats.
+        """
+        value = value.strip()
+        units = {"m":60,"h":3600,"d":86400,"w":604800}
+        if len(value) > 1 and value[-1].lower() in units and value[:-1].isdigit():
+            return time.time() - int(value[:-1]) * units[value[-1].lower()]
+        for format in ('%Y-%m-%d %H:%M:%S','%Y-%m-%d %H:%M','%Y-%m-%d'):
+            try:
+                return datetime.strptime(value,format).timestamp()
+            except ValueError:
+                pass
+        raise ValueError(f"Can't understand the date {value}. Use YYYY-MM-DD [HH:MM] or a time ago like 12h or 2d.")
+
+    def search_entries(self,query,name=None,categories="",limit=20):
+        """Prints the cached entries that best match the query, with their feed, date and link.
+
+        Args:
+            query (string): The words to search for.
+            name (string, optional): If present, only entries of this feed are searched. Defaults to None.
+            categories (string, optional): Category query (see category_helper.parse_query). If present,
+            only entries of the matching feeds are searched. Defaults to "".
+            limit (int, optional): Maximum number of results. Defaults to 20.
+        """
+        start = time.perf_counter()
+        if name != None:
+            feeds = {name.upper()}
+        elif len(categories) > 0:
+            feeds = set(self.categories.select(self.feeds,categories))
+        else:
+            feeds = None
+        results = self.cache.search(query,feeds,limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for feed,e in results:
+            if e["published_parsed"] != None:
+                date = time.strftime('%Y-%m-%d',time.struct_time(e["published_parsed"]))
+            else:
+                date = e["published"]
+            print(self.output.write_feed_header(f"{feed} - {date}") + self.output.write_feed_entry(e["title"]) + self.output.write_feed_link(e["link"]))
+        self.output.write_info(f"{len(results)} result(s) in {elapsed:.0f} ms.")
+
+    def export_entries(self,name=None,categories="",unread_only=False,since=None,limit=None,offset=0,order="feed"):
+        """Writes cached entries to stdout as newline-delimited json, one object per entry, so other
+        programs can use them without going through the colored text of read. Entries are read from the
+        cache, converted and written one at a time, so the output starts right away and memory use
+        doesn't grow with the number of entries. Nothing is marked as read.
+
+        Args:
+            name (string, optional): If present, only entries of this feed are exported. Defaults to None.
+            categories (string, optional): Category query (see category_helper.parse_query). Defaults to "".
+            unread_only (bool, optional): If True, only unread entries are exported. Defaults to False.
+            since (float, optional): Only entries published at or after this unix timestamp are exported.
+            Defaults to None.
+            limit (int, optional): Maximum number of entries. Defaults to None, no limit.
+            offset (int, optional): Number of entries to skip first. Defaults to 0.
+            order (string, optional): "feed" exports the feeds one after another; "newest" merges the
+            entries of every feed, newest first. Defaults to "feed".
+
+        Returns:
+            int: Number of entries written. Everything else the command prints goes to stderr.
+        """
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr): #Messages like the verbose ones would mix with the json.
+            if name != None:
+                if name.upper() not in self.feeds:
+                    self.output.write_error(f"There's no feed called {name}.")
+                    return 0
+                lst = [name.upper()]
+            else:
+                lst = self.categories.select(self.feeds,categories)
+            if unread_only:
+                lst = [n for n in lst if self.feeds[n]["unread"] > 0]
+            if order == "newest":
+                rows = self.cache.iter_newest(lst,since)
+            else:
+                rows = ((n,e) for n in lst for e in self.cache.iter_entries(n,since))
+
+            states = {}
+            def records():
+                for n,e in rows:
+                    if n not in states: #Read states are only loaded for the feeds that are reached.
+                        states[n] = (self.cache.unread_states(n),datetime.strptime(self.feeds[n]["last_read"],'%Y-%m-%d %H:%M:%S'))
+                    id = entry_id(e)
+                    unread = self.is_unread(e,states[n][0].get(entry_digest(id)),states[n][1])
+                    if unread_only and unread == False:
+                        continue
+                    published = entry_timestamp(e)
+                    yield {
+                        "feed":n,
+                        "categories":self.feeds[n]["categories"],
+                        "id":id,
+                        "title":e["title"],
+                        "link":e["link"],
+                        "published":datetime.fromtimestamp(published,timezone.utc).isoformat() if published != None else None,
+                        "summary":e["summary"],
+                        "text":e["summary_text"] if "summary_text" in e else html_to_text(e["summary"]),
+                        "unread":unread
+                    }
+
+            written = 0
+            try:
+                for record in itertools.islice(records(),offset,offset + limit if limit != None else None):
+                    out.write(json.dumps(record,ensure_ascii=False) + "\n")
+                    written += 1
+                out.flush()
+            except BrokenPipeError: #The reader stopped early, like head does.
+                os.dup2(os.open(os.devnull,os.O_WRONLY),out.fileno()) #So the flush at exit doesn't fail again.
+            if self.verbose:print(f"{written} entries exported.")
+        return written
+
+    def show_feeds(self,categories = ""):
+        """self.outputs information from saved feeds.
+
+        Args:
+            categories (string, optional): Category query (see category_helper.parse_query). If
+            present, filters the result. Defaults to "".
+        """
+        lst = self.categories.select(self.feeds,categories)
+        for n in lst:
+            url = self.feeds[n]["url"]
+            last_checked = self.feeds[n]["last_check"]
+            last_read = self.feeds[n]["last_read"]
+            unread = self.feeds[n]["unread"]
+            valid = self.feeds[n]["valid"]
+            feed_categories = ", ".join(self.feeds[n]["categories"])
+            next_check = self.scheduler.next_check(self.feeds[n]).strftime('%Y-%m-%d %H:%M:%S')
+            self.output.write_info(f"{n}: {url}")
+            print(f"Last checked: {last_checked}. Last read: {last_read}")
+            if "interval" in self.feeds[n]:
+                interval = self.feeds[n]["interval"]
+                reason = self.feeds[n]["interval_reason"]
+                print(f"Next check: {next_check}. Polled every {interval} minute(s) ({reason})")
+            else:
+                print(f"Next check: {next_check}")
+            print(f"Unread entries: {unread}")
+            print(f"Categories: {feed_categories}")
+            if "failures" in self.feeds[n]:
+                failures = self.feeds[n]["failures"]
+                error = self.feeds[n]["last_error"]
+                self.output.write_error(f"Failed {failures} time(s) in a row, last error: {error}")
+            if valid== False:
+                self.output.write_error("WARNING: This feed is no longer valid and will not be updated.")
+            print("\n")
+
+    def import_feeds(self,source,assume_yes=False,bozo_policy="ask",force=False):
+        """Tries to parse and import an opml file exported from another RSS reader. Will try
+        to keep name and categories. Every feed is fetched concurrently, problems are reported together
+        at the end, and feedinfo and the cache are saved once for all the imported feeds.
+
+        Args:
+            source (string): Path of the opml file.
+            assume_yes (bool, optional): If True, doesn't ask for confirmation before importing. Defaults to False.
+            bozo_policy (string, optional): What to do with feeds that have problems: "ask" asks once for
+            all of them, "accept" adds them and "skip" leaves them out. Defaults to "ask".
+            force (bool, optional): If True, feeds without entries are imported too. Defaults to False.
+        """
+        import listparser
+        result = listparser.parse(source)
+        name = result.meta.title
+        size = len(result.feeds)
+        if assume_yes:
+            answer = "y"
+        else:
+            self.output.write_info(f"Do you want to import {size} feeds from {name}? [y]es/[n]o/[v]iew")
+            answer = input()
+        if answer.lower() == "v" or answer.lower() == "view":
+            for i in result.feeds:
+                print(f"{i.title} : {i.url}")
+            return
+        if answer.lower() != "y" and answer.lower() != "yes":
+            return
+
+        candidates = []
+        for i in result.feeds:
+            if self.verbose:print("Grabbing categories")
+            categories = normalize_categories(i.categories)
+            candidates.append((i.title,self.normalize_url(i.url),categories))
+        self.output.write_info(f"Checking {len(candidates)} feeds...")
+        fetches = self.updater.fetch_urls([url for _,url,_ in candidates])
+
+        accepted = []
+        problems = []
+        for (title,url,categories),future in zip(candidates,fetches):
+            try:
+                f = self.updater.wait(future)
+            except Exception as e:
+                self.output.write_error(f"Something went wrong when importing {title}!: {e}")
+                continue
+            if f["status"] == None or f["status"] >= 400:
+                reason = f"error {f['status']}" if f["status"] != None else f["bozo_exception"]
+                self.output.write_error(f"Couldn't fetch {title} ({reason}), skipping it.")
+                continue
+            if len(f["entries"]) == 0 and force == False:
+                self.output.write_error(f"No entries detected on feed {title}, skipping it. Import again with the '-f' flag to add feeds without entries.")
+                continue
+            if f["bozo"]:
+                problems.append((title,url,categories,f))
+            else:
+                accepted.append((title,url,categories,f))
+        self.cache.close_parse_pool()
+
+        if len(problems) > 0:
+            self.output.write_error(f"A problem was detected with {len(problems)} feed(s). You may find problems when reading their entries:")
+            for title,_,_,f in problems:
+                print(f"{title}: {f['bozo_exception']}")
+            if bozo_policy == "ask":
+                self.output.write_error("Do you want to add them? [Y]es/[N]o")
+                answer = input()
+                add_problems = answer.lower() != "n" and answer.lower() != "no"
+            else:
+                add_problems = bozo_policy == "accept"
+            if add_problems:
+                accepted += problems
+
+        for title,url,categories,f in accepted:
+            self.remove_categories(title.upper())
+            self.feeds[title.upper()] = self.new_feed(url,categories,f)
+            self.categories.add(title.upper(),self.feeds[title.upper()]["categories"])
+        self.save_feed_file()
+        self.cache.save_many({title:f for title,_,_,f in accepted})
+        self.output.write_ok(f"{len(accepted)} of {size} feeds imported successfully.")
+
+    def mark_as_read(self,name,categories=""):
+        """Will update the last_read and unread properties of each feed to set them up to date. If the
+        background updater is running, it's asked to do it instead, so its feed list stays in sync.
+
+        Args:
+            name (string): Name of the feed that wants to be cleared. If none, will apply to all feeds.
+            categories (string, optional): Category query (see category_helper.parse_query). If present,
+            will filter results. Defaults to "".
+        """
+        if self.daemon.send("clear",name=name,categories=categories) != None:
+            if self.verbose:print("Cleared by the background updater.")
+            return
+        self.clear_feeds(name,categories)
+        self.save_feed_file()
+
+    def clear_feeds(self,name,categories=""):
+        """Sets the last_read and unread properties of the selected feeds up to date and marks their cached
+        entries as read. feedinfo.json is not saved.
+
+        Args:
+            name (string): Name of the feed that wants to be cleared. If none, will apply to all feeds.
+            categories (string, optional): Category query (see category_helper.parse_query). If present,
+            will filter results. Defaults to "".
+        """
+        if name != None and self.feeds[name.upper()] != None:
+            lst = [name.upper()]
+        else:
+            lst = self.categories.select(self.feeds,categories)
+        for f in lst:
+            feed = self.feeds[f]
+            feed["last_read"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            feed["unread"] = 0
+        self.cache.mark_read(lst)
+
+    def run_background_updater(self):
+        """Runs the background updater: checks for new entries every update_time_minutes and answers the
+        commands sent to its control socket until it's told to stop.
+        """
+        self.is_daemon = True
+        self.update_requested = False
+        self.in_cycle = False
+        self.last_update = None
+        self.last_compact = time.monotonic()
+        self.scheduler.build(self.feeds)
+        try:
+            self.daemon.serve(self.handle_updater_command,self.updater_tick)
+        finally:
+            self.save_feed_file()
+            if os.path.isfile("rssclient.pid"):
+                os.remove("rssclient.pid")
+
+    def updater_tick(self):
+        """Called by the background updater about once per second. Checks the feeds whose next check
+        has passed, sends the collected notifications, writes feedinfo.json if a write was postponed, and
+        compacts the cache every archive_compact_hours."""
+        if self.update_requested:
+            self.update_requested = False
+            self.run_update_cycle(list(self.feeds),True)
+        else:
+            due = self.scheduler.pop_due()
+            if len(due) > 0:
+                self.run_update_cycle(due)
+        self.notify.flush()
+        self.feedinfo.flush(self.feeds,self.config["feedinfo_flush_seconds"])
+        if self.config["archive_compact_hours"] > 0 and time.monotonic() - self.last_compact > self.config["archive_compact_hours"] * 3600:
+            self.last_compact = time.monotonic()
+            try:
+                removed = self.cache.compact()
+                if self.verbose:print(f"Compacted the cache, {removed} entries removed.")
+            except Exception as e:
+                self.output.write_error(f"Something went wrong when compacting the cache: {e}")
+
+    def run_update_cycle(self,names,ignore_schedule=False):
+        """Checks the indicated feeds from the background updater and puts them back in the queue.
+
+        Args:
+            names (list of strings): Names of the feeds to check.
+            ignore_schedule (bool, optional): If True, the feeds are fetched even if they're not due yet.
+            Defaults to False.
+        """
+        self.in_cycle = True
+        try:
+            self.check_new_entries(to_console=False,force_refresh=False,names=names,ignore_schedule=ignore_schedule)
+        except Exception as e: #A failed update shouldn't stop the updater.
+            self.output.write_error(f"Something went wrong when checking for new entries: {e}")
+        finally:
+            self.in_cycle = False
+        self.last_update = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.scheduler.build(self.feeds)
+
+    def handle_updater_command(self,request):
+        """Answers a command received by the background updater.
+
+        Args:
+            request (dictionary): The command and its arguments.
+
+        Returns:
+            dictionary: The answer sent back to the caller.
+        """
+        command = request.get("command")
+        if self.verbose:print(f"Received {command}")
+        if command == "merge":
+            self.merge_changes(request)
+            self.save_feed_file()
+        elif command == "update":
+            self.update_requested = True
+        elif command == "clear":
+            self.clear_feeds(request.get("name"),request.get("categories",""))
+            self.save_feed_file()
+        elif command == "status":
+            next_run = self.scheduler.next_run()
+            return {
+                "ok":True,
+                "pid":os.getpid(),
+                "feeds":len(self.feeds),
+                "unread":sum(f["unread"] for f in self.feeds.values()),
+                "last_update":self.last_update,
+                "next_update":next_run.strftime('%Y-%m-%d %H:%M:%S') if next_run != None else None
+            }
+        elif command == "stats":
+            return dict({"ok":True},**self.stats.summary())
+        elif command == "stop":
+            self.daemon.running = False
+        else:
+            return {"ok":False,"error":f"Unknown command {command}"}
+        return {"ok":True}
+
+    def start_background_updater(self,silent=False):
+        """Will create the rssclient.pid file and start the background process. Time is self.configurable on the
+        self.config.json file.
+
+        Args:
+            silent (bool, optional): [If True, will not print to terminal the status messages]. Defaults to False.
+        """
+        if self.verbose:print("Trying to start updater...")
+        proc = sp.Popen([sys.executable,SCRIPT,"show","--bg"])
+        w = open("rssclient.pid","w")
+        w.write(str(proc.pid))
+        w.close()
+        if silent == False:
+            if self.verbose:print("Done")
+            self.output.write_ok("Background updater started successfully. Each feed will be checked for new entries as often as it's updated.")
+
+    def stop_background_updater(self,silent=False):
+        """Will ask the background process to stop. If it doesn't answer, it's killed using the pid saved
+        in the rssclient.pid file.
+
+        Args:
+            silent (bool, optional): If True, will not print to terminal the status messages. Defaults to False.
+
+        Raises:
+            IOError: If the updater is not running.
+        """
+        if self.daemon.send("stop") == None:
+            with open('rssclient.pid') as f:
+                pid = f.read()
+                os.kill(int(pid),signal.SIGTERM)
+            os.remove('rssclient.pid')
+        if silent == False:
+            self.output.write_ok("Background updater stopped successfully.")
+
+    def show_updater_status(self):
+        """Prints the status reported by the background updater."""
+        try:
+            status = self.daemon.send("status")
+        except UpdaterBusy as e:
+            self.output.write_error(str(e))
+            return
+        if status == None:
+            self.output.write_info("Background updater is not running.")
+            return
+        self.output.write_ok(f"Background updater running (PID {status['pid']}).")
+        print(f"Feeds: {status['feeds']}. Unread entries: {status['unread']}")
+        print(f"Last update: {status['last_update']}. Next update: {status['next_update']}")
+
+    def compact_cache(self):
+        """Removes the archived entries that are over the retention limits from every feed and shrinks
+        the cache file."""
+        if os.path.isfile(self.cache.path) == False:
+            self.output.write_info("There's no cache to compact.")
+            return
+        before = os.path.getsize(self.cache.path)
+        removed = self.cache.compact(True)
+        after = os.path.getsize(self.cache.path)
+        self.output.write_ok(f"Removed {removed} old entries. Cache size: {before / 1024:.0f} KB -> {after / 1024:.0f} KB.")
+
+    def show_stats(self,format="text"):
+        """Prints the measures of the last update cycles: how long they took, how many fetches got a 304,
+        and which feeds are the slowest and the heaviest to update.
+
+        Args:
+            format (string, optional): "text", "json" or "prometheus". Defaults to "text".
+        """
+        summary = self.stats.summary()
+        if format == "json":
+            print(json.dumps(summary,indent=4))
+            return
+        if format == "prometheus":
+            print(self.stats.prometheus(summary),end="")
+            return
+        if summary["cycles"] == 0:
+            self.output.write_info("No update cycles recorded yet. Run update first.")
+            return
+        self.output.write_info(f"Last {summary['cycles']} update cycle(s):")
+        print(f"Duration: last {summary['last_cycle_s']:.2f}s, average {summary['average_cycle_s']:.2f}s, max {summary['max_cycle_s']:.2f}s")
+        ratio = summary["not_modified_ratio"]
+        print(f"Fetches: {summary['fetches']}. Not modified (304): {ratio * 100:.0f}%" if ratio != None else "Fetches: 0")
+        if summary["unchanged"] > 0:
+            print(f"Of those, {summary['unchanged']} were full feeds identical to the last one, which weren't parsed or saved again.")
+        if summary["partial"] > 0:
+            print(f"Feeds parsed only up to their first known entry: {summary['partial']}")
+        print("Statuses: " + ", ".join(f"{s}: {c}" for s,c in sorted(summary["statuses"].items())))
+        print(f"Downloaded: {summary['bytes'] / 1024:.1f} KB. Saved by compression: {summary['bytes_saved'] / 1024:.1f} KB")
+        if summary["average_render_s"] != None:
+            print(f"Average read rendering time: {summary['average_render_s']:.2f}s")
+        self.output.write_info("Slowest feeds (average seconds per fetch):")
+        for n,t in summary["slowest"]:
+            print(f"{n}: {t:.3f}s")
+        self.output.write_info("Heaviest feeds (average KB per fetch):")
+        for n,b in summary["heaviest"]:
+            print(f"{n}: {b / 1024:.1f} KB")
+
+    def is_updater_running(self):
+        return self.daemon.send("status") != None
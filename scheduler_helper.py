@@ -0,0 +1,190 @@
+import heapq
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+
+class SchedulerHelper():
+    def __init__(self,config):
+        """Decides when each feed should be polled next. The interval of every feed adapts to how often
+        it publishes, the caching headers and ttl its server sends, and how many times in a row it
+        answered without changes, always between min_poll_minutes and max_poll_minutes. Feeds that fail
+        are retried with exponential backoff, and after circuit_breaker_failures failures in a row they
+        are left alone for circuit_breaker_cooldown_minutes before being tried again. The background
+        updater keeps the feeds in a priority queue ordered by their next check.
+
+        Args:
+            config (object): A json object parsing the config.json file.
+        """
+        self.config = config
+        self.verbose = config["verbose_mode"]
+        self.queue = []
+
+    def next_check(self,feed):
+        """Returns when the feed should be polled next. Feeds saved by older versions don't have a
+        schedule yet, so they use update_time_minutes since their last check.
+
+        Args:
+            feed (object): Feed object to get data from.
+
+        Returns:
+            datetime: Date of the next check.
+        """
+        if "next_check" in feed:
+            return datetime.strptime(feed["next_check"],'%Y-%m-%d %H:%M:%S')
+        last_check = datetime.strptime(feed["last_check"],'%Y-%m-%d %H:%M:%S')
+        return last_check + timedelta(minutes=self.config["update_time_minutes"])
+
+    def plan(self,feed,result,error=""):
+        """Calculates the interval of a feed after it was fetched and saves its next check on the feed
+        object, along with the reason for the chosen interval.
+
+        Args:
+            feed (object): Feed object to update.
+            result (dictionary): The compact result of the fetch. None if the fetch failed.
+            error (string, optional): Why the fetch failed, if it did. Defaults to "".
+        """
+        interval = feed.get("interval",self.config["update_time_minutes"])
+        reason = "default interval"
+        status = result["status"] if result != None else None
+        headers = result.get("headers",{}) if result != None else {}
+
+        if self.failed(status) == False and "failures" in feed:
+            if self.verbose:print(f"Recovered after {feed['failures']} failure(s)")
+            feed.pop("failures")
+            feed.pop("last_error",None)
+
+        if self.failed(status):
+            feed["failures"] = feed.get("failures",0) + 1
+            if error == "" and status != None:
+                error = f"error {status}"
+            elif error == "":
+                error = result["bozo_exception"] if result != None and result["bozo_exception"] else "no response"
+            feed["last_error"] = error
+            interval = self.config["update_time_minutes"] * 2 ** min(feed["failures"] - 1,16) #Exponential backoff.
+            reason = f"{feed['failures']} failure(s) in a row"
+        elif status == 304:
+            feed["not_modified_streak"] = feed.get("not_modified_streak",0) + 1
+            interval = interval * 1.5
+            reason = f"no changes {feed['not_modified_streak']} time(s) in a row"
+        elif status in (200,302):
+            feed["not_modified_streak"] = 0
+            gap = self.publish_gap(result["entries"])
+            if gap != None:
+                interval = gap / 2 #Poll about twice per new entry.
+                reason = "entry frequency"
+            elif result.get("partial"):
+                reason = feed.get("interval_reason",reason) #Only the new entries were parsed; keep what the last full parse found.
+            else:
+                interval = self.config["update_time_minutes"]
+        else:
+            interval = self.config["update_time_minutes"]
+
+        ttl = self.ttl_minutes(result)
+        if ttl != None and ttl > interval:
+            interval,reason = ttl,"feed ttl"
+        cache = self.cache_minutes(headers)
+        if cache != None and cache > interval:
+            interval,reason = cache,"cache headers"
+        retry = self.retry_after_minutes(headers)
+        if retry != None and retry > interval:
+            interval,reason = retry,"retry-after header"
+
+        minimum = self.config["min_poll_minutes"]
+        maximum = self.config["max_poll_minutes"]
+        if interval < minimum:
+            interval = minimum
+        elif interval > maximum:
+            interval = maximum
+        if self.circuit_open(feed):
+            interval = max(interval,self.config["circuit_breaker_cooldown_minutes"])
+            reason = f"stopped after {feed['failures']} failures in a row"
+        jitter = self.config["poll_jitter"]
+        delay = interval * (1 + random.uniform(-jitter,jitter))
+        feed["interval"] = round(interval,1)
+        feed["interval_reason"] = reason
+        feed["next_check"] = (datetime.now() + timedelta(minutes=delay)).strftime('%Y-%m-%d %H:%M:%S')
+        if self.verbose:print(f"Next check in {delay:.1f} minute(s): {reason}")
+
+    def failed(self,status):
+        """Returns True if a fetch that got this status failed. Deleted feeds (410) aren't failures,
+        they're marked as invalid instead."""
+        return status == None or (status >= 400 and status != 410)
+
+    def circuit_open(self,feed):
+        """Returns True if the feed failed too many times in a row and is only tried again after
+        circuit_breaker_cooldown_minutes."""
+        limit = self.config["circuit_breaker_failures"]
+        return limit > 0 and feed.get("failures",0) >= limit
+
+    def publish_gap(self,entries):
+        """Returns the average number of minutes between the newest entries of a feed, or None if there
+        aren't enough dated entries to tell."""
+        dates = sorted((time.mktime(tuple(e["published_parsed"])) for e in entries if e.get("published_parsed")),reverse=True)[:20]
+        if len(dates) < 2 or dates[0] == dates[-1]:
+            return None
+        return (dates[0] - dates[-1]) / (len(dates) - 1) / 60
+
+    def ttl_minutes(self,result):
+        """Returns the value of the ttl element of an RSS feed, in minutes."""
+        if result == None or "feed" not in result:
+            return None
+        try:
+            return float(result["feed"]["ttl"])
+        except (KeyError,TypeError,ValueError):
+            return None
+
+    def cache_minutes(self,headers):
+        """Returns for how many minutes the server allows the feed to be cached, using Cache-Control
+        max-age or Expires."""
+        match = re.search(r"max-age=(\d+)",headers.get("cache-control",""))
+        if match:
+            return int(match.group(1)) / 60
+        if "expires" in headers:
+            return self.minutes_until(headers["expires"])
+        return None
+
+    def retry_after_minutes(self,headers):
+        """Returns the Retry-After header in minutes. It can be a number of seconds or a date."""
+        value = headers.get("retry-after","").strip()
+        if value.isdigit():
+            return int(value) / 60
+        if value:
+            return self.minutes_until(value)
+        return None
+
+    def minutes_until(self,date):
+        """Returns the minutes between now and an HTTP date, or None if it can't be parsed."""
+        from email.utils import parsedate_to_datetime
+        try:
+            target = parsedate_to_datetime(date)
+        except (TypeError,ValueError):
+            return None
+        now = datetime.now(target.tzinfo) if target.tzinfo != None else datetime.now()
+        return max(0,(target - now).total_seconds() / 60)
+
+    def build(self,feeds):
+        """Fills the queue with every valid feed, ordered by its next check.
+
+        Args:
+            feeds (dictionary): The self.feeds dictionary.
+        """
+        self.queue = [(self.next_check(feed),name) for name,feed in feeds.items() if feed["valid"]]
+        heapq.heapify(self.queue)
+
+    def pop_due(self):
+        """Takes every feed whose next check has already passed out of the queue.
+
+        Returns:
+            list of strings: Names of the feeds that should be polled now.
+        """
+        now = datetime.now()
+        due = []
+        while len(self.queue) > 0 and self.queue[0][0] <= now:
+            due.append(heapq.heappop(self.queue)[1])
+        return due
+
+    def next_run(self):
+        """Returns the date of the next check in the queue, or None if it's empty."""
+        return self.queue[0][0] if len(self.queue) > 0 else None
@@ -0,0 +1,165 @@
+import json
+import os
+import tempfile
+import time
+
+
+class StatsHelper():
+    def __init__(self,config,path='rssstats.json'):
+        """Keeps timing and size measures of the last update cycles in the rssstats.json file. For every
+        feed of a cycle it records how long it took to fetch, parse, save and render, how many bytes were
+        downloaded and the HTTP status received. Only the last stats_cycles cycles of each kind are kept. If
+        stats_export_path is set, a summary in the Prometheus text format is written there after every cycle.
+
+        Args:
+            config (object): A json object parsing the config.json file.
+            path (string, optional): Path of the stats file. Defaults to 'rssstats.json'.
+        """
+        self.config = config
+        self.verbose = config["verbose_mode"]
+        self.path = path
+        self.cycle = None
+
+    def start_cycle(self,kind):
+        """Starts recording a new cycle.
+
+        Args:
+            kind (string): "update" or "read".
+        """
+        self.cycle = {"kind":kind,"started":time.time(),"duration_s":0,"feeds":{}}
+
+    def record(self,name,**measures):
+        """Adds measures of a feed to the current cycle. Times (keys ending in _s) and byte counts are
+        added to the ones already recorded; other values replace them."""
+        if self.cycle == None:
+            return
+        feed = self.cycle["feeds"].setdefault(name,{})
+        for key,value in measures.items():
+            if value == None:
+                continue
+            if key.endswith("_s") or key.startswith("bytes"):
+                feed[key] = round(feed.get(key,0) + value,6)
+            else:
+                feed[key] = value
+
+    def end_cycle(self):
+        """Finishes the current cycle and saves it with the previous ones."""
+        if self.cycle == None:
+            return
+        self.cycle["duration_s"] = round(time.time() - self.cycle["started"],6)
+        cycles = self.load()
+        cycles.append(self.cycle)
+        cycles = self.window(cycles)
+        self.cycle = None
+        self.write(self.path,json.dumps(cycles))
+        if self.config["stats_export_path"] != "":
+            self.write(self.config["stats_export_path"],self.prometheus(self.summary()))
+        if self.verbose:print("Stats saved.")
+
+    def window(self,cycles):
+        """Returns the last stats_cycles cycles of each kind, oldest first, so frequent reads never push
+        the updates out of the file."""
+        counts = {}
+        kept = []
+        for c in reversed(cycles):
+            counts[c["kind"]] = counts.get(c["kind"],0) + 1
+            if counts[c["kind"]] <= self.config["stats_cycles"]:
+                kept.append(c)
+        return kept[::-1]
+
+    def write(self,path,text):
+        """Writes a file through a temporary file renamed into place, so readers never see half of it."""
+        folder = os.path.dirname(os.path.abspath(path))
+        fd,tmp = tempfile.mkstemp(prefix='.rssstats.',suffix='.tmp',dir=folder)
+        try:
+            with os.fdopen(fd,'w') as f:
+                f.write(text)
+            os.replace(tmp,path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def load(self):
+        """Returns the saved cycles, oldest first."""
+        try:
+            with open(self.path) as f:
+                return json.loads(f.read())
+        except (IOError,ValueError):
+            return []
+
+    def summary(self,top=5):
+        """Aggregates the saved cycles.
+
+        Args:
+            top (int, optional): How many feeds to list as slowest and heaviest. Defaults to 5.
+
+        Returns:
+            dictionary: Cycle durations, 304 ratio, how many of the 304s were identical feeds detected by
+            their digest, how many feeds were parsed incrementally, and the slowest and heaviest feeds on
+            average.
+        """
+        cycles = self.load()
+        updates = [c for c in cycles if c["kind"] == "update"]
+        reads = [c for c in cycles if c["kind"] == "read"] #Their duration includes the time spent reading.
+        feeds = {}
+        statuses = {}
+        unchanged = 0
+        partial = 0
+        for c in updates:
+            for name,m in c["feeds"].items():
+                if "status" not in m:
+                    continue #Not fetched on this cycle.
+                total = feeds.setdefault(name,{"fetches":0,"time_s":0,"bytes":0,"bytes_saved":0})
+                total["fetches"] += 1
+                total["time_s"] += m.get("fetch_s",0) + m.get("parse_s",0) + m.get("save_s",0)
+                total["bytes"] += m.get("bytes",0)
+                total["bytes_saved"] += m.get("bytes_saved",0)
+                statuses[str(m["status"])] = statuses.get(str(m["status"]),0) + 1
+                if m.get("unchanged"):
+                    unchanged += 1
+                if m.get("partial"):
+                    partial += 1
+        average = {n:{"time_s":round(t["time_s"]/t["fetches"],4),"bytes":t["bytes"]//t["fetches"]} for n,t in feeds.items()}
+        fetches = sum(statuses.values())
+        durations = [c["duration_s"] for c in updates]
+        return {
+            "cycles":len(updates),
+            "last_cycle_s":durations[-1] if durations else None,
+            "average_cycle_s":round(sum(durations)/len(durations),4) if durations else None,
+            "max_cycle_s":max(durations) if durations else None,
+            "fetches":fetches,
+            "statuses":statuses,
+            "not_modified_ratio":round(statuses.get("304",0)/fetches,4) if fetches else None,
+            "unchanged":unchanged,
+            "partial":partial,
+            "bytes":sum(t["bytes"] for t in feeds.values()),
+            "bytes_saved":sum(t["bytes_saved"] for t in feeds.values()),
+            "average_render_s":round(sum(sum(m.get("render_s",0) for m in c["feeds"].values()) for c in reads)/len(reads),4) if reads else None,
+            "slowest":sorted(([n,a["time_s"]] for n,a in average.items()),key=lambda x:x[1],reverse=True)[:top],
+            "heaviest":sorted(([n,a["bytes"]] for n,a in average.items()),key=lambda x:x[1],reverse=True)[:top]
+        }
+
+    def prometheus(self,summary):
+        """Formats a summary in the Prometheus text exposition format."""
+        lines = []
+        def metric(name,kind,help,samples):
+            lines.append(f"# HELP termrss_{name} {help}")
+            lines.append(f"# TYPE termrss_{name} {kind}")
+            for labels,value in samples:
+                if value != None:
+                    lines.append(f"termrss_{name}{labels} {value}")
+        metric("cycles","gauge","Update cycles kept in the stats file.",[("",summary["cycles"])])
+        metric("last_cycle_seconds","gauge","Duration of the last update cycle.",[("",summary["last_cycle_s"])])
+        metric("average_cycle_seconds","gauge","Average duration of the kept update cycles.",[("",summary["average_cycle_s"])])
+        metric("fetches","gauge","Fetches by HTTP status on the kept cycles.",[(f'{{status="{s}"}}',c) for s,c in sorted(summary["statuses"].items())])
+        metric("not_modified_ratio","gauge","Fraction of fetches answered with 304.",[("",summary["not_modified_ratio"])])
+        metric("unchanged_feeds","gauge","Fetches that got the same feed as the last time, counted as 304 without parsing it.",[("",summary["unchanged"])])
+        metric("partial_parses","gauge","Fetches where only the entries before the first known one were parsed.",[("",summary["partial"])])
+        metric("downloaded_bytes","gauge","Bytes downloaded on the kept cycles.",[("",summary["bytes"])])
+        metric("compression_saved_bytes","gauge","Bytes compression saved on the kept cycles.",[("",summary["bytes_saved"])])
+        metric("feed_seconds","gauge","Average fetch, parse and save time of the slowest feeds.",[(f'{{feed="{self.label(n)}"}}',t) for n,t in summary["slowest"]])
+        metric("feed_bytes","gauge","Average download size of the heaviest feeds.",[(f'{{feed="{self.label(n)}"}}',b) for n,b in summary["heaviest"]])
+        return "\n".join(lines) + "\n"
+
+    def label(self,value):
+        return value.replace("\\","\\\\").replace('"','\\"').replace("\n","\\n")
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from fetch_helper import FetchError
+
+#Seconds given to a fetch past its deadline to finish parsing before it's given up on.
+DEADLINE_GRACE = 5
+
+
+class UpdateHelper():
+    def __init__(self,cache_helper,config):
+        """Runs the network side of an update cycle concurrently. Fetches are spread over a thread pool
+        limited by max_concurrent_fetches, and each host never gets more than max_fetches_per_host
+        requests at the same time; the fetches over that limit wait in a queue for their host, not on a
+        worker. Results are only returned, never applied, so feedinfo and the cache
+        are always modified from the main thread. Results are waited for with wait, which gives up on a
+        fetch fetch_deadline_seconds after it started, so a hung server can't stall a cycle.
+
+        Args:
+            cache_helper (CacheHelper object): An initialized CacheHelper instance. Used to fetch the feeds.
+            config (object): A json object parsing the config.json file.
+        """
+        self.cache = cache_helper
+        self.config = config
+        self.verbose = config["verbose_mode"]
+        self.max_workers = max(1,int(config["max_concurrent_fetches"]))
+        self.per_host = max(1,int(config["max_fetches_per_host"]))
+        self.started = {}
+        self.lock = threading.Lock()
+
+    def fetch(self,batch,host,future,started,url,etag,modified,digest,head,force_refresh):
+        """Fetches a single feed, then hands the next queued fetch of its host to the pool. Runs on a
+        worker thread.
+
+        Args:
+            batch (dictionary): The queues of the submit call the fetch belongs to (see submit).
+            host (string): Host of the feed.
+            future (Future): Gets the result of the fetch, or the exception it ended with.
+            started (dictionary): Gets the time the fetch started, and its event is set then.
+        """
+        started["time"] = time.monotonic()
+        started["event"].set()
+        try:
+            future.set_result(self.cache.fetch_feed(url,etag,modified,force_refresh,digest,head))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                batch["running"][host] -= 1
+                batch["left"] -= 1
+                self.start_next(batch,host)
+                if batch["left"] == 0: #Lets the worker threads exit.
+                    batch["pool"].shutdown(wait=False)
+
+    def wait(self,future,idle=None):
+        """Returns the result of a fetch started by fetch_all or fetch_urls. Fetches still waiting for a
+        worker or a host slot are waited for as long as needed, but once a fetch starts it only gets
+        fetch_deadline_seconds (and a few more to parse) to finish.
+
+        Args:
+            future (Future): The future of the fetch.
+            idle (function, optional): Called about once per second while waiting. Used by the
+            background updater to keep answering commands during a cycle. Defaults to None.
+
+        Returns:
+            dictionary: The compact result of the fetch.
+
+        Raises:
+            FetchError: If the fetch didn't finish in time.
+            Exception: The exception the fetch ended with.
+        """
+        from concurrent.futures import TimeoutError
+        started = self.started.pop(future,None)
+        deadline = self.config["fetch_deadline_seconds"]
+        while True:
+            if idle != None:
+                idle()
+            timeout = 1
+            if started != None and deadline > 0 and started["event"].is_set():
+                left = started["time"] + deadline + DEADLINE_GRACE - time.monotonic()
+                if left <= 0 and future.done() == False:
+                    raise FetchError(f"No answer after {deadline} seconds")
+                timeout = max(0,min(timeout,left))
+            try:
+                return future.result(timeout=timeout)
+            except TimeoutError:
+                if future.done():
+                    raise #The fetch itself timed out.
+
+    def fetch_all(self,feeds,names,force_refresh):
+        """Starts fetching every indicated feed in the background.
+
+        Args:
+            feeds (dictionary): The self.feeds dictionary.
+            names (list of strings): Names of the feeds to fetch.
+            force_refresh (bool): If True, will ignore etag and modified and download the full feeds.
+
+        Returns:
+            dictionary: Future for each feed name. Passing it to wait returns the compact result or
+            raises the exception the fetch ended with.
+        """
+        jobs = [self.fetch_args(feeds[n]) + (force_refresh,) for n in names]
+        return dict(zip(names,self.submit(jobs)))
+
+    def fetch_urls(self,urls):
+        """Starts downloading the full contents of every indicated url in the background. Used to
+        check feeds that are not on the list yet.
+
+        Args:
+            urls (list of strings): Urls of the feeds.
+
+        Returns:
+            list: Future for each url, in the same order.
+        """
+        return self.submit([(url,"","","",[],True) for url in urls])
+
+    def submit(self,jobs):
+        """Runs the fetches on a new thread pool and returns their futures. Each host has its own queue,
+        and a fetch is only handed to a worker once its host has a free slot, so fetches waiting for a
+        busy host never hold a worker that a fetch from another host could use."""
+        from concurrent.futures import ThreadPoolExecutor, Future
+        if self.verbose:print(f"Fetching {len(jobs)} feed(s) with {self.max_workers} worker(s)...")
+        batch = {"pool":ThreadPoolExecutor(max_workers=self.max_workers),"queues":{},"running":{},"left":len(jobs)}
+        futures = []
+        for job in jobs:
+            future = Future()
+            started = {"event":threading.Event()}
+            self.started[future] = started
+            host = urlparse(job[0]).netloc.lower()
+            batch["queues"].setdefault(host,deque()).append((future,started) + job)
+            futures.append(future)
+        with self.lock:
+            for host in batch["queues"]:
+                batch["running"][host] = 0
+                self.start_next(batch,host)
+            if len(jobs) == 0:
+                batch["pool"].shutdown(wait=False)
+        return futures
+
+    def start_next(self,batch,host):
+        """Hands queued fetches of a host to the pool while the host has free slots. Called with
+        self.lock held."""
+        queue = batch["queues"][host]
+        while len(queue) > 0 and batch["running"][host] < self.per_host:
+            batch["running"][host] += 1
+            batch["pool"].submit(self.fetch,batch,host,*queue.popleft())
+
+    def fetch_args(self,feed):
+        """Copies the values a fetch needs, so worker threads never read the feed objects the main
+        thread is updating."""
+        head = feed.get("head",[]) if self.config["incremental_parse"] and feed.get("ordered") else []
+        return (feed["url"],feed["etag"],feed["last-modified"],feed.get("digest",""),list(head))